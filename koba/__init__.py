@@ -1,3 +1,5 @@
+from koba import timing
+
 import importlib.metadata
 
 __version__ = importlib.metadata.version("koba")
@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import platform
+import itertools
+import statistics
+import tracemalloc
+import concurrent.futures
+
+import click
+import numpy as np
+from PIL import Image, ImageDraw
+
+from koba import __version__
+from koba.core import cache, charsets, core, pipeline, shm, unify
+
+CHARSETS = {
+    "ascii": (32, 126),
+    "braille": (10240, 10495),
+    "geometric": (9632, 9727),
+}
+
+RESOLUTIONS = {
+    "sd": (640, 360),
+    "hd": (1280, 720),
+    "fullhd": (1920, 1080),
+}
+
+VIDEO_FRAMES = 24
+
+TEXT = "The quick brown fox jumps over the lazy dog. 0123456789 {}[]()<>+-*/=%$#@!?"
+
+def gradient(width, height):
+    x = np.linspace(0, 255, width)
+    y = np.linspace(0, 255, height)[:, None]
+    return np.stack(np.broadcast_arrays(x + 0 * y, y + 0 * x, (x + y) / 2), axis=-1).astype(np.uint8)
+
+def text(width, height):
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    for i, y in enumerate(range(4, height - 10, 14)):
+        draw.text((4 - (i * 7) % 60, y), TEXT * (width // 300 + 1), fill="black")
+    return np.array(img)
+
+def noise(width, height):
+    return np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+def video(width, height):
+    """A ball moving over a gradient, so consecutive frames share most blocks."""
+    background = gradient(width, height)
+    y, x = np.ogrid[:height, :width]
+    radius = height / 6
+    frames = []
+    for i in range(VIDEO_FRAMES):
+        frame = background.copy()
+        cx = radius + (width - 2 * radius) * i / (VIDEO_FRAMES - 1)
+        cy = height / 2 + height / 4 * np.sin(i / VIDEO_FRAMES * 2 * np.pi)
+        frame[(x - cx) ** 2 + (y - cy) ** 2 <= radius ** 2] = (255, 64, 0)
+        frames.append(frame)
+    return frames
+
+CORPUS = {
+    "gradient": gradient,
+    "text": text,
+    "noise": noise,
+    "video": video,
+}
+
+def make_corpus(name, resolution):
+    """The frames of a corpus entry at a resolution, a list of (h, w, 3) arrays."""
+    frames = CORPUS[name](*RESOLUTIONS[resolution])
+    return frames if isinstance(frames, list) else [frames]
+
+CACHE_MB = 64
+
+def render(frames, engine, charset, block_cache, executor=None, frame_ring=None):
+    """Renders the frames like koba does and returns the rendered frames."""
+    start_char, end_char = CHARSETS[charset]
+    characters = charsets.get_range(start_char, end_char)
+    options = (2, 1.0, engine, False, False, False, False, start_char, end_char, False, None)
+    if len(frames) > 1:
+        rendered = [
+            rendered for _, rendered in pipeline.render_frames(
+                iter(frames), *options, executor=executor, frame_ring=frame_ring,
+                block_cache=block_cache, characters=characters
+            )
+        ]
+    else:
+        rendered = [core.process_frame(
+            frames[0], *options, single_threaded=executor is None, executor=executor,
+            block_cache=block_cache, characters=characters, frame_ring=frame_ring
+        )]
+    return rendered
+
+def run_case(frames, engine, charset, repeat=3, executor=None, frame_ring=None, quality="exact", expected=None):
+    """
+    Times the rendering of a corpus entry. The first run warms the glyph
+    stacks, which earlier cases of a sweep may have built already, so the
+    second one measures the peak memory of the main process. The others
+    are timed with a cold block cache each. The fixed size tables of the
+    block cache are left out of the peak memory. The divergence is the
+    share of cells whose character differs from the expected code grids.
+    """
+    render(frames, engine, charset, cache.BlockCache(CACHE_MB * 2 ** 20, quality), executor, frame_ring)
+    block_cache = cache.BlockCache(CACHE_MB * 2 ** 20, quality)
+    tracemalloc.start()
+    try:
+        rendered = render(frames, engine, charset, block_cache, executor, frame_ring)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat):
+        block_cache = cache.BlockCache(CACHE_MB * 2 ** 20, quality)
+        start = time.perf_counter()
+        rendered = render(frames, engine, charset, block_cache, executor, frame_ring)
+        times.append(time.perf_counter() - start)
+
+    seconds = statistics.median(times)
+    rows, cols = rendered[0].shape
+    divergence = 0.0
+    if expected is not None:
+        divergence = float(np.mean([np.mean(frame.codes != codes) for frame, codes in zip(rendered, expected)]))
+    return {
+        "frames": len(frames),
+        "grid": [rows, cols],
+        "seconds": seconds,
+        "fps": len(frames) / seconds,
+        "blocks_per_second": rows * cols * len(frames) / seconds,
+        "matched_blocks": block_cache.misses,
+        "peak_mb": peak / 2 ** 20,
+        "divergence": divergence,
+    }
+
+def run(corpus, engines, charset_names, resolutions, modes, repeat, columns, progress=None, qualities=("exact",)):
+    """
+    Sweeps every combination and returns the results document. Qualities
+    below exact are compared with the output of exact matching.
+    """
+    core.columns = columns
+    unify.set_kernel_threads(1)
+    results = []
+    # code grids of exact matching per corpus entry, resolution, engine and charset
+    exact_codes = {}
+    for charset in charset_names:
+        characters = charsets.get_range(*CHARSETS[charset])
+        core.init_worker(characters)
+        for mode in modes:
+            executor = frame_ring = None
+            if mode == "multi":
+                executor = concurrent.futures.ProcessPoolExecutor(initializer=core.init_worker, initargs=(characters,))
+                frame_ring = shm.FrameRing(1, n_slots=pipeline.PIPELINE_DEPTH)
+            try:
+                for name in corpus:
+                    for resolution in resolutions:
+                        frames = make_corpus(name, resolution)
+                        for engine, quality in itertools.product(engines, qualities):
+                            expected = None
+                            if quality != "exact":
+                                key = (name, resolution, engine, charset)
+                                if key not in exact_codes:
+                                    exact_codes[key] = [frame.codes for frame in render(
+                                        frames, engine, charset, cache.BlockCache(CACHE_MB * 2 ** 20), executor, frame_ring
+                                    )]
+                                expected = exact_codes[key]
+                            case = "/".join((name, resolution, engine, charset, mode, quality))
+                            result = {
+                                "case": case, "corpus": name, "resolution": resolution,
+                                "engine": engine, "charset": charset, "mode": mode, "quality": quality,
+                            }
+                            result.update(run_case(frames, engine, charset, repeat, executor, frame_ring, quality, expected))
+                            results.append(result)
+                            if progress:
+                                progress(result)
+            finally:
+                if executor:
+                    executor.shutdown()
+                    frame_ring.close()
+    return {
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "columns": columns,
+        "repeat": repeat,
+        "results": results,
+    }
+
+def compare(baseline, current, threshold):
+    """
+    Cases of current that are slower or use more memory than in baseline by
+    more than threshold (a fraction), as (case, metric, old, new) tuples.
+    """
+    old_results = {result["case"]: result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = old_results.get(result["case"])
+        if old is None:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            if result[metric] > old[metric] * (1 + threshold):
+                regressions.append((result["case"], metric, old[metric], result[metric]))
+    return regressions
+
+def format_result(result):
+    rows, cols = result["grid"]
+    return (
+        f"{result['case']:<46} {cols}x{rows:<5} {result['fps']:8.2f} fps {result['blocks_per_second']:11.0f} blocks/s "
+        f"{result['matched_blocks']:7d} matched {result['peak_mb']:8.1f} MB {result['divergence']:7.1%} diverged"
+    )
+
+@click.command()
+@click.option("--corpus", "corpus", multiple=True, type=click.Choice(list(CORPUS)), help="Corpus entries to render. Default: all.")
+@click.option("-e", "--engine", "engines", multiple=True, default=("diff", "mse", "brightness"), show_default=True, help="Engines to sweep.")
+@click.option("--charset", "charset_names", multiple=True, type=click.Choice(list(CHARSETS)), help="Character sets to sweep. Default: all.")
+@click.option("--resolution", "resolutions", multiple=True, type=click.Choice(list(RESOLUTIONS)), default=("sd", "hd"), show_default=True, help="Source resolutions to sweep.")
+@click.option("--mode", "modes", multiple=True, type=click.Choice(["single", "multi"]), default=("single", "multi"), show_default=True, help="Match blocks in this process or in worker processes.")
+@click.option("--quality", "qualities", multiple=True, type=click.Choice(list(cache.QUALITIES)), default=("exact",), show_default=True, help="Block cache qualities to sweep, see koba --quality.")
+@click.option("--repeat", default=3, show_default=True, help="Timed runs per case, the median is reported.")
+@click.option("--columns", default=120, show_default=True, help="Output width in characters.")
+@click.option("-o", "--output", type=click.Path(dir_okay=False), help="Write the results to this JSON file.")
+@click.option("--compare", "baseline_path", type=click.Path(exists=True, dir_okay=False), help="Flag regressions against the results in this JSON file.")
+@click.option("--threshold", default=0.2, show_default=True, help="Slowdown or memory growth (as a fraction) that counts as a regression.")
+def main(corpus, engines, charset_names, resolutions, modes, qualities, repeat, columns, output, baseline_path, threshold):
+    """Benchmarks koba on a generated corpus."""
+    current = run(
+        corpus or list(CORPUS), engines, charset_names or list(CHARSETS), resolutions, modes,
+        repeat, columns, lambda result: click.echo(format_result(result)), qualities
+    )
+    if output:
+        with open(output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, threshold)
+        for case, metric, old, new in regressions:
+            click.echo(f"REGRESSION {case}: {metric} {old:.3f} -> {new:.3f} ({new / old - 1:+.0%})", err=True)
+        if regressions:
+            sys.exit(1)
+        click.echo(f"No regressions against {baseline_path}.")
+
+if __name__ == "__main__":
+    main()
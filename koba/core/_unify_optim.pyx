@@ -1,11 +1,14 @@
 import numpy as np
 cimport numpy as np
 cimport cython
+from cython.parallel cimport prange
+from libc.math cimport sqrt, fabs, INFINITY
 
-from PIL import Image
-from koba.core.unify import get_char
 from koba.core._unify_shared import get_char
 
+# engines with a batch kernel, mapped to the codes used inside the kernels
+KERNEL_ENGINES = {"diff": 0, "mse": 1, "brightness": 2, "ncc": 3, "cosine": 4}
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 def compare_character(
@@ -52,4 +55,112 @@ def compare_character(
         score = abs(avg_char - avg_block)
         similarity = 1.0 - (score / 255.0)
         
-    return similarity
\ No newline at end of file
+    return similarity
+
+@cython.cdivision(True)
+cdef double _similarity(
+    const np.uint8_t* block,
+    const np.uint8_t* glyph,
+    Py_ssize_t size,
+    int engine,
+    double block_mean,
+    double block_std,
+    double block_norm,
+    double glyph_mean,
+    double glyph_std,
+    double glyph_norm
+) noexcept nogil:
+    cdef Py_ssize_t i
+    cdef long long total = 0
+    cdef int delta
+
+    if engine == 0:
+        for i in range(size):
+            delta = block[i] - glyph[i]
+            total += delta if delta >= 0 else -delta
+        return 1.0 - total / (size * 255.0)
+    elif engine == 1:
+        for i in range(size):
+            delta = block[i] - glyph[i]
+            total += delta * delta
+        return 1.0 - (<double>total / size) / (255.0 * 255.0)
+    elif engine == 2:
+        return 1.0 - fabs(glyph_mean - block_mean) / 255.0
+    elif engine == 3:
+        if block_std == 0 or glyph_std == 0:
+            if block_std == 0 and glyph_std == 0 and block_mean == glyph_mean:
+                return 1.0
+            return 0.0
+        for i in range(size):
+            total += block[i] * glyph[i]
+        # sum((a - mean_a) * (b - mean_b)) == sum(a * b) - size * mean_a * mean_b
+        return ((total - size * block_mean * glyph_mean) / (block_std * glyph_std * size) + 1) / 2
+    else:
+        if block_norm == 0 or glyph_norm == 0:
+            return 1.0 if block_norm == 0 and glyph_norm == 0 else 0.0
+        for i in range(size):
+            total += block[i] * glyph[i]
+        return (total / (block_norm * glyph_norm) + 1) / 2
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def best_glyphs(
+    const np.uint8_t[:, ::1] glyphs,
+    const np.uint8_t[::1] valid,
+    const double[::1] glyph_means,
+    const double[::1] glyph_stds,
+    const double[::1] glyph_norms,
+    const np.uint8_t[:, ::1] blocks,
+    object engine,
+    int num_threads=1
+):
+    """
+    Index of the most similar glyph for every block. Glyphs and blocks are
+    flattened into (n, h * w) arrays. Blocks are spread over num_threads
+    OpenMP threads without holding the GIL; ties keep the lowest index.
+    """
+    cdef int code = KERNEL_ENGINES[engine]
+    cdef Py_ssize_t n_blocks = blocks.shape[0]
+    cdef Py_ssize_t n_glyphs = glyphs.shape[0]
+    cdef Py_ssize_t size = blocks.shape[1]
+    cdef Py_ssize_t b, g, i, best_index
+    cdef long long block_sum, block_sq_sum
+    cdef double block_mean, block_std, block_norm, deviation, similarity, best_similarity
+
+    result = np.zeros(n_blocks, dtype=np.intp)
+    cdef Py_ssize_t[::1] best = result
+    if n_glyphs == 0 or size == 0:
+        return result
+
+    for b in prange(n_blocks, nogil=True, num_threads=max(1, num_threads), schedule="static"):
+        block_sum = 0
+        block_sq_sum = 0
+        for i in range(size):
+            block_sum = block_sum + blocks[b, i]
+            block_sq_sum = block_sq_sum + <long long>blocks[b, i] * blocks[b, i]
+        block_mean = <double>block_sum / size
+        block_norm = sqrt(<double>block_sq_sum)
+        block_std = 0.0
+        if code == 3:
+            for i in range(size):
+                deviation = blocks[b, i] - block_mean
+                block_std = block_std + deviation * deviation
+            block_std = sqrt(block_std / size)
+
+        best_index = 0
+        best_similarity = -INFINITY
+        for g in range(n_glyphs):
+            if valid[g]:
+                similarity = _similarity(
+                    &blocks[b, 0], &glyphs[g, 0], size, code, block_mean, block_std, block_norm,
+                    glyph_means[g], glyph_stds[g], glyph_norms[g]
+                )
+            else:
+                similarity = 0.0
+            if similarity > best_similarity:
+                best_similarity = similarity
+                best_index = g
+        best[b] = best_index
+
+    return result
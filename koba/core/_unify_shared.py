@@ -2,18 +2,36 @@ from PIL import ImageFont, ImageDraw, Image
 import numpy as np
 import logging
 import os
+from koba import timing
 from . import font
 
 FONT_SIZE = 20
-font_path = font.get_monospace_font()
+# the main font, looked up on first use unless set_font_path picked one
+font_path = None
 font_cache = {}
 char_cache = {}
 
 
+def get_font_path():
+    global font_path
+    if font_path is None:
+        with timing.span("font lookup"):
+            font_path = font.get_default_font() or ""
+    return font_path
+
+def set_font_path(path):
+    """Switches the main font and drops everything rendered with the old one."""
+    global font_path
+    if path != font_path:
+        font_path = path
+        font_cache.clear()
+        char_cache.clear()
+
 def get_font(char):
     if char not in font_cache.keys():
-        if font_path and font.check_support(char, font_path):
-            font_cache[char] = ImageFont.truetype(font_path, FONT_SIZE)
+        main_font = get_font_path()
+        if main_font and font.check_support(char, main_font):
+            font_cache[char] = ImageFont.truetype(main_font, FONT_SIZE)
         else:
             new_font = font.get_supported_font(char)
             if new_font:
@@ -68,6 +86,22 @@ def get_char(char, width, height, save=False):
         char_cache[(char, width, height)] = char_arr
         return char_arr
 
+def render_glyphs(characters, width, height, save=False, progress_callback=None):
+    """
+    Renders characters into one (n, h, w) array. Characters without visible
+    pixels stay black and are marked False in the returned mask.
+    """
+    glyphs = np.zeros((len(characters), height, width), dtype=np.uint8)
+    valid = np.zeros(len(characters), dtype=bool)
+    for i, char in enumerate(characters):
+        char_arr = get_char(char, width, height, save)
+        if char_arr is not None:
+            glyphs[i] = char_arr
+            valid[i] = True
+        if progress_callback:
+            progress_callback()
+    return glyphs, valid
+
 def pre_render_characters(characters, sizes, save_chars, progress_callback=None):
     for size in sizes:
         width, height = size
@@ -0,0 +1,74 @@
+import functools
+
+import numpy as np
+
+RESET = "\033[0m"
+
+# bits per color channel of the Frame color grid for every --color-depth
+COLOR_DEPTHS = {"truecolor": 24, "256": 8, "16": 4}
+
+# xterm's default colors for SGR 30-37 and 90-97
+SYSTEM_COLORS = [
+    (0, 0, 0), (205, 0, 0), (0, 205, 0), (205, 205, 0), (0, 0, 238), (205, 0, 205), (0, 205, 205), (229, 229, 229),
+    (127, 127, 127), (255, 0, 0), (0, 255, 0), (255, 255, 0), (92, 92, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255),
+]
+
+# channel bits of the lookup table from RGB to palette index
+LUT_BITS = 5
+
+@functools.lru_cache(maxsize=None)
+def palette(depth):
+    """RGB values of the palette entries, by palette index."""
+    if depth == 4:
+        return np.array(SYSTEM_COLORS, dtype=np.uint8)
+    # the 6x6x6 cube and the gray ramp of the 256 color palette, the system colors vary between terminals
+    levels = np.array([0, 95, 135, 175, 215, 255])
+    cube = np.stack(np.meshgrid(levels, levels, levels, indexing="ij"), axis=-1).reshape(-1, 3)
+    grays = np.repeat(np.arange(8, 248, 10)[:, None], 3, axis=1)
+    return np.concatenate([cube, grays]).astype(np.uint8)
+
+@functools.lru_cache(maxsize=None)
+def sgr_codes(depth):
+    """Foreground SGR sequence of every palette index."""
+    if depth == 4:
+        return [f"\033[{30 + i if i < 8 else 90 + i - 8}m" for i in range(16)]
+    return [f"\033[38;5;{16 + i}m" for i in range(len(palette(depth)))]
+
+@functools.lru_cache(maxsize=None)
+def lookup_table(depth):
+    """Nearest palette index for every cell of a quantized RGB cube."""
+    step = 1 << (8 - LUT_BITS)
+    centers = np.arange(1 << LUT_BITS) * step + step // 2
+    cube = np.stack(np.meshgrid(centers, centers, centers, indexing="ij"), axis=-1).reshape(-1, 3).astype(np.float64)
+    colors = palette(depth).astype(np.float64)
+    # squared distances without the constant |cube|^2 term
+    distances = (colors ** 2).sum(axis=1) - 2 * cube @ colors.T
+    return distances.argmin(axis=1).astype(np.uint8).reshape((1 << LUT_BITS,) * 3)
+
+def quantize(colors, depth):
+    """
+    Maps an (..., 3) RGB array to the color grid of a depth: unchanged for
+    truecolor, palette indices for 256 and 16 colors.
+    """
+    if depth == 24:
+        return colors
+    bins = colors >> (8 - LUT_BITS)
+    return lookup_table(depth)[bins[..., 0], bins[..., 1], bins[..., 2]]
+
+def colorize(text, colors, depth):
+    """
+    Colors a run of cells, with an SGR sequence only where the color differs
+    from the cell before and one reset at the end.
+    """
+    n = len(text)
+    if not n:
+        return ""
+    flat = colors.reshape(n, -1)
+    starts = np.flatnonzero(np.concatenate(([True], (flat[1:] != flat[:-1]).any(axis=1))))
+    ends = np.append(starts[1:], n).tolist()
+    if depth == 24:
+        codes = [f"\033[38;2;{r};{g};{b}m" for r, g, b in flat[starts].tolist()]
+    else:
+        table = sgr_codes(depth)
+        codes = [table[i] for i in flat[starts, 0].tolist()]
+    return "".join([f"{code}{text[start:end]}" for code, start, end in zip(codes, starts.tolist(), ends)]) + RESET
@@ -0,0 +1,67 @@
+import os
+import sys
+import json
+import hashlib
+
+import numpy as np
+
+from koba import __version__
+from . import _unify_shared
+
+def cache_dir():
+    """koba's user cache directory, KOBA_CACHE_DIR overrides the platform default."""
+    if os.environ.get("KOBA_CACHE_DIR"):
+        return os.environ["KOBA_CACHE_DIR"]
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "koba", "Cache")
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Caches/koba")
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "koba")
+
+def atlas_path(characters, width, height):
+    """Atlas file for a font, font size, character set and cell shape."""
+    key = {
+        "font": _unify_shared.get_font_path(),
+        "font_size": _unify_shared.FONT_SIZE,
+        "characters": hashlib.sha256("".join(characters).encode()).hexdigest(),
+        "shape": [width, height],
+        "version": __version__,
+    }
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:32]
+    return os.path.join(cache_dir(), "atlas", f"{digest}.npy")
+
+def load_atlas(characters, width, height, progress_callback=None):
+    """
+    Returns the (n, h, w) glyph array and the mask of visible glyphs for a
+    character set and cell shape. Atlases are rendered once, saved to the
+    user cache directory and memory-mapped read-only afterwards, so that
+    every run and every worker process shares the same pages.
+    """
+    path = atlas_path(characters, width, height)
+    valid_path = path[:-len(".npy")] + ".valid.npy"
+    try:
+        glyphs = np.load(path, mmap_mode="r")
+        valid = np.load(valid_path)
+    except (OSError, ValueError):
+        glyphs, valid = _unify_shared.render_glyphs(characters, width, height, progress_callback=progress_callback)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # the mask is written last and marks a complete atlas
+            for array, target in ((glyphs, path), (valid, valid_path)):
+                temporary = f"{target}.{os.getpid()}.tmp"
+                with open(temporary, "wb") as f:
+                    np.save(f, array)
+                os.replace(temporary, target)
+            glyphs = np.load(path, mmap_mode="r")
+        except OSError:
+            pass
+    else:
+        if progress_callback:
+            progress_callback(len(characters))
+
+    # the per-glyph engines read the same pages through char_cache
+    for char, char_arr, visible in zip(characters, glyphs, valid):
+        if visible:
+            _unify_shared.char_cache.setdefault((char, width, height), char_arr)
+    return glyphs, valid
@@ -0,0 +1,157 @@
+import numpy as np
+
+# a 64-bit key, a 32-bit code point and a 32-bit last-use tick per entry
+ENTRY_BYTES = 16
+WAYS = 8
+
+# thumbnail (columns, rows, gray levels) of the block signatures per --quality,
+# "exact" keys blocks by their pixels
+QUALITIES = {
+    "exact": None,
+    "high": (4, 8, 16),
+    "medium": (3, 6, 8),
+    "low": (2, 4, 4),
+}
+
+_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+def _mix(h):
+    """splitmix64 finalizer, spreads every input bit over the whole digest."""
+    h = h ^ (h >> np.uint64(30))
+    h = h * _MIX_1
+    h = h ^ (h >> np.uint64(27))
+    h = h * _MIX_2
+    return h ^ (h >> np.uint64(31))
+
+def block_digests(blocks, shape=None):
+    """
+    64-bit digests of a batch of blocks, given as (n, ...) uint8 array.
+    The block shape, or shape if given, is part of the digest.
+    """
+    count = len(blocks)
+    flat = np.ascontiguousarray(blocks).reshape(count, -1)
+    padding = -flat.shape[1] % 8
+    if padding:
+        flat = np.pad(flat, ((0, 0), (0, padding)))
+    words = flat.view(np.uint64)
+
+    seed = 0
+    for dimension in shape or blocks.shape[1:]:
+        seed = (seed * 1_000_003 + dimension) % 2 ** 64
+    digests = np.full(count, seed, dtype=np.uint64)
+    for column in range(words.shape[1]):
+        digests = _mix((digests ^ words[:, column]) * _MULTIPLIER)
+    return digests
+
+def thumbnail_edges(size, cells):
+    """Start of every thumbnail cell along an axis of size pixels."""
+    return np.arange(cells) * size // cells
+
+def block_signatures(blocks, grid):
+    """
+    Perceptual signatures of a batch of (n, h, w) blocks: the means of a grid
+    of rows x columns cells, quantized to a few gray levels and hashed with
+    the block shape. Blocks that look alike share a signature.
+    """
+    columns, rows, levels = grid
+    count, height, width = blocks.shape
+    rows, columns = min(rows, height), min(columns, width)
+    y_starts, x_starts = thumbnail_edges(height, rows), thumbnail_edges(width, columns)
+    sums = np.add.reduceat(np.add.reduceat(blocks, y_starts, axis=1, dtype=np.uint32), x_starts, axis=2)
+    areas = np.outer(np.diff(y_starts, append=height), np.diff(x_starts, append=width))
+    thumbnails = (sums * levels // (areas * 256)).astype(np.uint8)
+    return block_digests(thumbnails, (height, width) + tuple(grid))
+
+class BlockCache:
+    """
+    Memory-bounded cache from block digests to code points.
+
+    Entries live in fixed NumPy tables organized as an 8-way set-associative
+    cache, so the memory use is fixed by the byte budget no matter how large
+    the blocks are. A full set evicts its least recently used entry.
+
+    Below "exact" quality, blocks are keyed by their perceptual signature,
+    which memoizes one glyph for all blocks that look alike.
+    """
+
+    def __init__(self, max_bytes, quality="exact"):
+        self.quality = quality
+        self.grid = QUALITIES[quality]
+        self.n_sets = max(1, int(max_bytes) // (ENTRY_BYTES * WAYS))
+        self.keys = np.zeros((self.n_sets, WAYS), dtype=np.uint64)
+        self.values = np.zeros((self.n_sets, WAYS), dtype=np.uint32)
+        # 0 marks an empty slot, used slots store the tick of their last use
+        self.ticks = np.zeros((self.n_sets, WAYS), dtype=np.uint32)
+        self.tick = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.ticks))
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.values.nbytes + self.ticks.nbytes
+
+    def digests(self, blocks):
+        """Keys of a batch of (n, h, w) blocks at the quality of the cache."""
+        if self.grid is None:
+            return block_digests(blocks)
+        return block_signatures(blocks, self.grid)
+
+    def _sets(self, digests):
+        return (digests % np.uint64(self.n_sets)).astype(np.intp)
+
+    def lookup(self, digests, count=True):
+        """
+        Returns a found mask and the cached code points (0 where missing).
+        With count=False the caller records hits and misses itself.
+        """
+        sets = self._sets(digests)
+        matches = (self.keys[sets] == digests[:, None]) & (self.ticks[sets] > 0)
+        found = matches.any(axis=1)
+        ways = matches.argmax(axis=1)
+        values = np.where(found, self.values[sets, ways], 0).astype(np.uint32)
+
+        self.tick += 1
+        self.ticks[sets[found], ways[found]] = self.tick
+        if count:
+            self.hits += int(found.sum())
+            self.misses += int(len(digests) - found.sum())
+        return found, values
+
+    def insert(self, digests, values):
+        """Stores code points, evicting the least recently used entry of full sets."""
+        digests = np.asarray(digests, dtype=np.uint64)
+        values = np.asarray(values, dtype=np.uint32)
+        self.tick += 1
+        while len(digests):
+            # one entry per set and round, so that the vectorized writes do not collide
+            sets = self._sets(digests)
+            _, first = np.unique(sets, return_index=True)
+            round_sets = sets[first]
+
+            existing = (self.keys[round_sets] == digests[first, None]) & (self.ticks[round_sets] > 0)
+            ways = np.where(existing.any(axis=1), existing.argmax(axis=1), self.ticks[round_sets].argmin(axis=1))
+            replaced = ~existing.any(axis=1) & (self.ticks[round_sets, ways] > 0)
+            self.evictions += int(replaced.sum())
+
+            self.keys[round_sets, ways] = digests[first]
+            self.values[round_sets, ways] = values[first]
+            self.ticks[round_sets, ways] = self.tick
+
+            remaining = np.ones(len(digests), dtype=bool)
+            remaining[first] = False
+            digests = digests[remaining]
+            values = values[remaining]
+
+    def stats(self):
+        requests = self.hits + self.misses
+        hit_rate = self.hits / requests if requests else 0.0
+        return (
+            f"Block cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate), "
+            f"{self.evictions} evictions, {len(self)} entries in {self.nbytes / 2 ** 20:.1f} MB."
+        )
@@ -1,28 +1,83 @@
 import os
 import sys
 import math
+import time
 import logging
-import concurrent.futures
+import itertools
 
 import numpy as np
-from tqdm import tqdm
 from PIL import Image, ImageOps
 
-from koba.core import charsets, unify
+from koba import timing
+from koba.core import ansi, cache, charsets, mosaic, shm, unify
+from koba.core.frame import Frame
 
-def init_worker(characters_for_worker):
+def init_worker(characters_for_worker, font=None, use_atlas=True):
     """Initializer for each worker process."""
+    unify.set_glyph_source(font, use_atlas)
     unify.set_worker_characters(characters_for_worker)
 
-def chunk_list(data, n):
-    """Splits a list into n roughly equal chunks."""
-    if n <= 0:
-        return [data]
-    k, m = divmod(len(data), n)
-    return [data[i*k+min(i, m):(i+1)*k+min(i+1, m)] for i in range(n)]
+def match_shared_blocks(ring_name, slot_bytes, slot, frame_shape, block_shape, coords, engine, save_chars, index, probes):
+    """
+    Worker side of the shared memory dispatch: matches the blocks at the given
+    pixel coordinates of a frame in a ring slot and returns compact glyph indices.
+    """
+    start = time.perf_counter()
+    with shm.read_slot(ring_name, slot_bytes, slot, frame_shape) as frame:
+        windows = np.lib.stride_tricks.sliding_window_view(frame, block_shape)
+        blocks = windows[coords[:, 0], coords[:, 1]]
+        del windows, frame
+    result = unify.match_blocks(blocks, engine, save_chars, None, index, probes).astype(np.int32)
+    # the busy time of the worker, for --profile
+    return result, start, time.perf_counter(), os.getpid()
+
+def measure_index(blocks, engine, index, probes, sample_size=1024):
+    """Measures an index against the exhaustive search on a sample of blocks, per block shape."""
+    blocks_by_shape = {}
+    for block in blocks[:sample_size]:
+        blocks_by_shape.setdefault(block.shape, []).append(block)
+    return [
+        unify.measure_index_accuracy(np.stack(shape_blocks), engine, index, probes)
+        for shape_blocks in blocks_by_shape.values()
+    ]
+
+def group_sizes(sizes):
+    """Runs of equal block sizes as (first index, count, size, pixel offset) tuples."""
+    groups = []
+    index = offset = 0
+    for size, run in itertools.groupby(sizes):
+        count = len(list(run))
+        groups.append((index, count, size, offset))
+        index += count
+        offset += count * size
+    return groups
+
+def split_blocks(arr, block_widths, block_heights):
+    """
+    Views an image as one (rows, cols, h, w) block array per block shape
+    without copying any pixels. Returns (first row, first column, view) tuples.
+    """
+    regions = []
+    for row, n_rows, bh, y in group_sizes(block_heights):
+        for col, n_cols, bw, x in group_sizes(block_widths):
+            region = arr[y:y + n_rows * bh, x:x + n_cols * bw]
+            view = np.lib.stride_tricks.as_strided(
+                region,
+                shape=(n_rows, n_cols, bh, bw) + arr.shape[2:],
+                strides=(bh * region.strides[0], bw * region.strides[1]) + region.strides,
+                writeable=False
+            )
+            regions.append((row, col, view))
+    return regions
+
+# signature caches with up to this many signatures per block shape can be prewarmed
+PREWARM_SIGNATURES = 2 ** 16
+
+# output width in characters, None follows the terminal
+columns = None
 
 def calculate_block_sizes(width, height, char_aspect, scale):
-    terminal_width = os.get_terminal_size().columns
+    terminal_width = columns or os.get_terminal_size().columns
     chars_width = terminal_width
     
     min_block_width = 10 / char_aspect
@@ -51,27 +106,179 @@ def calculate_block_sizes(width, height, char_aspect, scale):
         
     return block_widths, block_heights, chars_width
 
-def process(
-    img, char_aspect, scale, engine, color, invert, stretch_contrast, 
-    save_blocks, start_char, end_char, save_chars, font, 
-    single_threaded, show_progress=False, 
-    executor=None, block_cache=None, characters=None
+def block_sums(arr, block_widths, block_heights):
+    """Sums of every block of arr, one reduction per axis whatever the block sizes."""
+    y_starts = np.cumsum([0] + block_heights[:-1])
+    x_starts = np.cumsum([0] + block_widths[:-1])
+    return np.add.reduceat(np.add.reduceat(arr, y_starts, axis=0, dtype=np.uint32), x_starts, axis=1)
+
+def frame_size(img):
+    """(width, height) of a PIL image or of a (height, width[, channels]) array."""
+    if isinstance(img, np.ndarray):
+        return img.shape[1], img.shape[0]
+    return img.size
+
+def to_image(img):
+    return Image.fromarray(img) if isinstance(img, np.ndarray) else img
+
+def working_size(width, height, char_aspect, scale, cell=None):
+    """
+    Smallest frame size with the aspect ratio of the source that still
+    gives every character at least one cell of pixels (8 pixels wide and
+    char_aspect times that high by default). Sources are never upscaled.
+    """
+    _, _, chars_width = calculate_block_sizes(width, height, char_aspect, scale)
+    cell_width, cell_height = cell or (8, 8 * char_aspect)
+    cell_width = max(cell_width, math.ceil(cell_height / char_aspect), math.ceil(10 / char_aspect))
+    # calculate_block_sizes limits the grid by the height as well
+    min_height = 10 * math.ceil(chars_width / char_aspect)
+    target_width = max(chars_width * cell_width, math.ceil(min_height * width / height))
+    if target_width >= width:
+        return width, height
+    target_height = max(1, math.ceil(height * target_width / width))
+    if calculate_block_sizes(target_width, target_height, char_aspect, scale)[2] != chars_width:
+        return width, height
+    return target_width, target_height
+
+def calculate_cell_grid(width, height, char_aspect, scale, cell):
+    """
+    Block layout for a fixed working resolution: the grid keeps the size
+    calculate_block_sizes would pick, but every block is exactly one cell.
+    """
+    _, block_heights, chars_width = calculate_block_sizes(width, height, char_aspect, scale)
+    cell_width, cell_height = cell
+    return [cell_width] * chars_width, [cell_height] * len(block_heights), chars_width
+
+def resize_to_cells(img, char_aspect, scale, cell):
+    """Resizes an image once so that it splits into whole cells."""
+    block_widths, block_heights, _ = calculate_cell_grid(img.width, img.height, char_aspect, scale, cell)
+    return img.resize((sum(block_widths), sum(block_heights)), Image.Resampling.BOX)
+
+def get_block_shapes(width, height, char_aspect, scale, cell=None):
+    """All distinct (width, height) block shapes of an image."""
+    if cell:
+        return {tuple(cell)}
+    block_widths, block_heights, _ = calculate_block_sizes(width, height, char_aspect, scale)
+    return {(w, h) for w in set(block_widths) for h in set(block_heights)}
+
+class Reference:
+    """
+    The pixels every cell was last matched on, for temporal coherence. A cell
+    whose mean absolute difference to its reference is below threshold keeps
+    the character of the previous frame. Comparing against the pixels of the
+    last match instead of the previous frame keeps slow changes from drifting.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.pixels = None
+        self.grid = None
+        # the last job, which the next one takes the reused characters from
+        self.job = None
+
+    def update(self, job, img_arr, block_widths, block_heights):
+        """Marks the cells of job that can be reused and moves the reference to the new frame."""
+        grid = (block_widths, block_heights)
+        if self.pixels is None or self.grid != grid:
+            self.pixels = img_arr.copy()
+            self.grid = grid
+            self.job = job
+            return
+
+        with timing.stage("temporal delta"):
+            delta = np.maximum(img_arr, self.pixels) - np.minimum(img_arr, self.pixels)
+            areas = np.outer(block_heights, block_widths)
+            reused = block_sums(delta, block_widths, block_heights) < self.threshold * areas
+            # only the cells that are matched again get new reference pixels
+            changed = np.repeat(np.repeat(~reused, block_heights, axis=0), block_widths, axis=1)
+            np.copyto(self.pixels, img_arr, where=changed)
+        job.previous = self.job
+        job.reused = reused
+        self.job = job
+        timing.count("reused cells", int(reused.sum()))
+
+class FrameJob:
+    """
+    One frame between the stages of process: converted to grayscale, split
+    into deduplicated blocks and looked up in the block cache. Every block
+    shape is one group; its missing blocks still need glyphs.
+    """
+
+    def __init__(self, img_arr, rows, chars_width, color, block_colors, characters, engine, code_grid=None, color_depth=24):
+        self.img_arr = img_arr
+        self.color = color
+        self.color_depth = color_depth
+        self.rows = rows
+        self.chars_width = chars_width
+        self.block_colors = block_colors
+        self.characters = characters
+        self.engine = engine
+        self.code_grid = code_grid
+        self.groups = []
+        # cells that keep the character of the previous job, see Reference
+        self.previous = None
+        self.reused = None
+
+    @property
+    def n_missing(self):
+        return sum(len(group["missing"]) for group in self.groups)
+
+    @property
+    def digests(self):
+        """Digests of the blocks this frame sends to matching."""
+        if not self.groups:
+            return np.zeros(0, dtype=np.uint64)
+        return np.concatenate([group["digests"][group["missing"]] for group in self.groups])
+
+    def missing_blocks(self):
+        return [block for group in self.groups for block in group["blocks"]]
+
+def prepare_frame(
+    img, char_aspect, scale, engine, color, invert, stretch_contrast, save_blocks,
+    start_char, end_char, block_cache=None, characters=None, cell=None, in_flight=None, color_depth="truecolor",
+    reference=None, analytic=None, dither="none"
 ):
-    if color:
-        img_color = img.convert("RGB")
-        img_arr_color = np.array(img_color)
-    
-    img = img.convert("L")
-    if invert:
-        img = ImageOps.invert(img)
-    if stretch_contrast:
-        img = ImageOps.autocontrast(img)
-    
-    img_arr = np.array(img)
-    height, width = img_arr.shape[:2]
+    """
+    First stage of process. Blocks whose digests are in in_flight are being
+    matched for an earlier frame; they are deferred to finish_frame, which
+    finds them in the block cache by then. With a Reference, cells that
+    barely changed since they were last matched keep their character.
+    With an analytic renderer (see mosaic.RANGES) the characters are
+    computed from the blocks and nothing is left to match.
+    """
+    with timing.stage("convert"):
+        width, height = frame_size(img)
+        if cell:
+            block_widths, block_heights, chars_width = calculate_cell_grid(width, height, char_aspect, scale, cell)
+            if (sum(block_widths), sum(block_heights)) != (width, height):
+                img = resize_to_cells(to_image(img), char_aspect, scale, cell)
+                width, height = img.size
+
+        if color:
+            if isinstance(img, np.ndarray) and img.ndim == 3:
+                img_arr_color = img
+            else:
+                img_arr_color = np.array(to_image(img).convert("RGB"))
+
+        # a single character needs no blocks, only their colors
+        single_char = start_char == end_char and not save_blocks
+        if single_char:
+            img_arr = None
+        elif isinstance(img, np.ndarray) and img.ndim == 2 and not stretch_contrast:
+            # gray frames from the video reader are used as they are
+            img_arr = 255 - img if invert else img
+        else:
+            img = to_image(img).convert("L")
+            if invert:
+                img = ImageOps.invert(img)
+            if stretch_contrast:
+                img = ImageOps.autocontrast(img)
+        
+            img_arr = np.array(img)
     logging.debug(f"Image is {width}x{height} pixels.")
     
-    block_widths, block_heights, chars_width = calculate_block_sizes(width, height, char_aspect, scale)
+    if not cell:
+        block_widths, block_heights, chars_width = calculate_block_sizes(width, height, char_aspect, scale)
 
     logging.debug(f"Image will be {chars_width}x{len(block_heights)} chars.")
 
@@ -79,96 +286,254 @@ def process(
         logging.critical("Image blocks are too small for SSIM. Please use another engine.")
         sys.exit(1)
 
-    # splitting into blocks with variable sizes
-    block_colors = []
-    blocks = []
-    y = 0
-    for bh in block_heights:
-        x = 0
-        for bw in block_widths:
-            block = img_arr[y:y+bh, x:x+bw]                
-            blocks.append(block)
-            x += bw
-        y += bh
-    
+    rows = len(block_heights)
+    regions = [] if single_char else split_blocks(img_arr, block_widths, block_heights)
+
+    block_colors = None
     if color:
+        with timing.stage("block colors"):
+            sums = block_sums(img_arr_color, block_widths, block_heights)
+            # integer division truncates exactly like the float means did
+            areas = np.outer(block_heights, block_widths)[..., None]
+            block_colors = (sums // areas).astype(np.uint8)
+    
+    if save_blocks:
+        os.makedirs("blocks", exist_ok=True)
+        idx = 0
         y = 0
         for bh in block_heights:
             x = 0
             for bw in block_widths:
-                block = img_arr_color[y:y+bh, x:x+bw]
-                block_color = block.mean(axis=(0, 1)).astype(int)            
-                block_colors.append(block_color)
+                Image.fromarray(img_arr[y:y+bh, x:x+bw]).save(os.path.join("blocks", f"{idx:04d}.png"))
+                idx += 1
                 x += bw
             y += bh
     
-    if save_blocks:
-        os.makedirs("blocks", exist_ok=True)
-        for idx, block in enumerate(blocks):
-            Image.fromarray(block).save(os.path.join("blocks", f"{idx:04d}.png"))
-    
-    print_chars = ""
-    
+    if characters is None:
+        characters = charsets.get_range(start_char, end_char)
+
+    job = FrameJob(
+        img_arr, rows, chars_width, color, block_colors, characters, engine.lower(),
+        color_depth=ansi.COLOR_DEPTHS[color_depth]
+    )
     if start_char == end_char:
-        all_chars = chr(start_char) * len(blocks)
-    else:
-        frame_results_map = {}
-        unique_blocks_map = {block.tobytes(): block for block in blocks}
-
-        if block_cache is not None:
-            blocks_to_process = []
-            for key, block in unique_blocks_map.items():
-                if key in block_cache:
-                    frame_results_map[key] = block_cache[key]
-                    block_cache.move_to_end(key)
-                else:
-                    blocks_to_process.append(block)
-        else:
-            blocks_to_process = list(unique_blocks_map.values())
-        
-        if blocks_to_process:
-            new_results = {}
-            if not single_threaded and executor:
-                n_workers = executor._max_workers
-                if not n_workers or n_workers <= 0:
-                    n_workers = 1
-                block_chunks = chunk_list(blocks_to_process, n_workers)
-                chunk_args = [(chunk, engine.lower(), save_chars) for chunk in block_chunks if chunk]
-                futures = [executor.submit(unify.process_blocks_batch, *arg) for arg in chunk_args]
-                for future in concurrent.futures.as_completed(futures):
-                    new_results.update(future.result())
-            else:
-                if characters is None:
-                    characters = charsets.get_range(start_char, end_char)
-                init_worker(characters)
-                for block in tqdm(blocks_to_process, desc="Processing unique blocks", disable=not show_progress):
-                    new_results[block.tobytes()] = unify.get_character(block, engine.lower(), save_chars)
+        job.code_grid = np.full((rows, chars_width), start_char, dtype=np.uint32)
+        return job
+    if not characters:
+        job.code_grid = np.full((rows, chars_width), ord(" "), dtype=np.uint32)
+        return job
+    if analytic:
+        with timing.stage("analytic"):
+            job.code_grid = mosaic.code_grid(analytic, img_arr, block_widths, block_heights, dither)
+        return job
 
+    timing.count("cells", rows * chars_width)
+    if reference is not None:
+        reference.update(job, img_arr, block_widths, block_heights)
+
+    # deduplicating every block shape once, the inverse index rebuilds the grid
+    for row, col, view in regions:
+        n_rows, n_cols, bh, bw = view.shape
+        cells = view.reshape(n_rows * n_cols, bh * bw)
+        changed = None
+        if job.reused is not None:
+            # flat indices of the cells of this region that are matched again
+            changed = np.flatnonzero(~job.reused[row:row + n_rows, col:col + n_cols])
+            if not len(changed):
+                continue
+            cells = cells[changed]
+        with timing.stage("dedupe"):
+            unique_blocks, first, inverse = np.unique(cells, axis=0, return_index=True, return_inverse=True)
+            unique_blocks = unique_blocks.reshape(-1, bh, bw)
+            if changed is not None:
+                first = changed[first]
+        with timing.stage("cache lookup"):
+            if block_cache is None:
+                digests = cache.block_digests(unique_blocks)
+            else:
+                digests = block_cache.digests(unique_blocks)
+                if block_cache.grid is not None:
+                    # blocks with one signature are matched once, by a representative
+                    digests, representatives, merged = np.unique(digests, return_index=True, return_inverse=True)
+                    unique_blocks = unique_blocks[representatives]
+                    first = first[representatives]
+                    inverse = merged[inverse]
+            deferred = np.zeros(len(unique_blocks), dtype=bool)
             if block_cache is not None:
-                block_cache.update(new_results)
-                while len(block_cache) > 1000000:
-                    block_cache.popitem(last=False)
-            frame_results_map.update(new_results)
+                found, codes = block_cache.lookup(digests, count=False)
+                if in_flight is not None and len(in_flight):
+                    deferred = ~found & np.isin(digests, in_flight)
+                # deferred blocks count as hits, the frame does not match them
+                hits = int(found.sum() + deferred.sum())
+                block_cache.hits += hits
+                block_cache.misses += len(digests) - hits
+                timing.count("cache hits", hits)
+                timing.count("cache misses", len(digests) - hits)
+            else:
+                found = np.zeros(len(unique_blocks), dtype=bool)
+                codes = np.zeros(len(unique_blocks), dtype=np.uint32)
+        timing.count("unique blocks", len(unique_blocks))
+        missing = np.nonzero(~found & ~deferred)[0]
+        # pixel position of one occurrence of every missing block
+        y = sum(block_heights[:row]) + first[missing] // n_cols * bh
+        x = sum(block_widths[:col]) + first[missing] % n_cols * bw
+        job.groups.append({
+            "row": row, "col": col, "n_rows": n_rows, "n_cols": n_cols, "inverse": inverse, "changed": changed,
+            "digests": digests, "codes": codes, "missing": missing, "deferred": np.nonzero(deferred)[0],
+            "blocks": unique_blocks[missing], "deferred_blocks": unique_blocks[deferred], "coords": np.stack([y, x], axis=1).astype(np.int32),
+        })
+    return job
 
-        results = [frame_results_map.get(block.tobytes()) for block in blocks]
-        all_chars = "".join(filter(None, results))
-    
-    lines = [all_chars[i:i+chars_width] for i in range(0, len(all_chars), chars_width)]
-
-    if not color:
-        return "\n".join(lines)
-
-    # Apply colors
-    print_chars = ""
-    color_idx = 0
-    for c in '\n'.join(lines):
-        if c == '\n':
-            print_chars += '\n'
-        elif color_idx < len(block_colors):
-            r, g, b = block_colors[color_idx]
-            print_chars += f"\033[38;2;{r};{g};{b}m{c}\033[0m"
-            color_idx += 1
-        else:
-            print_chars += c
-            
-    return print_chars
\ No newline at end of file
+def prewarm_cache(block_cache, block_shapes, characters, engine, save_chars=False, index="exhaustive", probes=unify.ANN_PROBES):
+    """
+    Matches every possible signature of the (width, height) block shapes
+    once and stores the glyphs in a signature cache, so that playback finds
+    every block in it. Returns False without doing anything if there are
+    more than PREWARM_SIGNATURES signatures per shape.
+    """
+    columns, rows, levels = block_cache.grid
+    grids = [(width, height, min(rows, height), min(columns, width)) for width, height in block_shapes]
+    if any(levels ** (n_rows * n_cols) > PREWARM_SIGNATURES for _, _, n_rows, n_cols in grids):
+        return False
+
+    char_codes = np.array(characters, dtype="U1").view(np.uint32)
+    for width, height, n_rows, n_cols in grids:
+        count = levels ** (n_rows * n_cols)
+        # every thumbnail, each cell at the middle gray of its level
+        thumbnails = np.arange(count)[:, None] // levels ** np.arange(n_rows * n_cols) % levels
+        grays = ((2 * thumbnails + 1) * 128 // levels).astype(np.uint8).reshape(count, n_rows, n_cols)
+        heights = np.diff(cache.thumbnail_edges(height, n_rows), append=height)
+        widths = np.diff(cache.thumbnail_edges(width, n_cols), append=width)
+        blocks = np.repeat(np.repeat(grays, heights, axis=1), widths, axis=2)
+        glyphs = unify.match_blocks(blocks, engine, save_chars, None, index, probes)
+        block_cache.insert(block_cache.digests(blocks), char_codes[glyphs])
+    return True
+
+def submit_frame(job, executor, frame_ring, save_chars, index, probes):
+    """
+    Second stage of process with a worker pool: writes the frame to the ring
+    and submits its missing blocks, returning one list of futures per group.
+    """
+    n_workers = executor._max_workers
+    if not n_workers or n_workers <= 0:
+        n_workers = 1
+    with timing.stage("dispatch"):
+        # workers read the pixels from shared memory, only coordinates are pickled
+        slot = frame_ring.write(job.img_arr)
+        group_futures = []
+        for group in job.groups:
+            coords = group["coords"]
+            chunks = np.array_split(coords, min(n_workers, len(coords))) if len(coords) else []
+            group_futures.append([
+                executor.submit(
+                    match_shared_blocks, frame_ring.name, frame_ring.slot_bytes, slot, job.img_arr.shape,
+                    group["blocks"].shape[1:], chunk, job.engine, save_chars, index, probes
+                )
+                for chunk in chunks
+            ])
+    return group_futures
+
+def collect_results(group_futures):
+    """Waits for the futures of submit_frame and returns the glyph indices per group."""
+    results = []
+    with timing.stage("wait for workers"):
+        for futures in group_futures:
+            chunks = []
+            for future in futures:
+                result, start, end, pid = future.result()
+                if timing.profiling:
+                    timing.record("worker match", start, end, pid=pid)
+                chunks.append(result)
+            results.append(np.concatenate(chunks) if chunks else None)
+    return results
+
+def match_frame(job, save_chars, index, probes, show_progress=False):
+    """Second stage of process without a worker pool, returns the glyph indices per group."""
+    from tqdm import tqdm
+    results = []
+    with timing.stage("match"), tqdm(total=job.n_missing, desc="Processing unique blocks", disable=not show_progress) as pbar:
+        for group in job.groups:
+            blocks = group["blocks"]
+            results.append(
+                unify.match_blocks(blocks, job.engine, save_chars, pbar.update, index, probes)
+                if len(blocks) else None
+            )
+    return results
+
+def finish_frame(job, results, block_cache=None, save_chars=False, index="exhaustive", probes=unify.ANN_PROBES):
+    """Last stage of process: stores the new glyphs in the cache and returns the rendered Frame."""
+    with timing.stage("finish"):
+        code_grid = assemble_codes(job, results, block_cache, save_chars, index, probes)
+    # the next frame may reuse these characters, the frame before is done
+    job.code_grid = code_grid
+    job.previous = None
+    if not job.color:
+        return Frame(code_grid)
+    with timing.stage("quantize"):
+        colors = ansi.quantize(job.block_colors, job.color_depth)
+    return Frame(code_grid, colors, job.color_depth)
+
+def assemble_codes(job, results, block_cache, save_chars, index, probes):
+    """Stores the new glyphs in the cache and fills the code grid of a frame."""
+    code_grid = job.code_grid
+    if code_grid is None:
+        char_codes = np.array(job.characters, dtype="U1").view(np.uint32)
+        code_grid = np.empty((job.rows, job.chars_width), dtype=np.uint32)
+        if job.reused is not None:
+            code_grid[job.reused] = job.previous.code_grid[job.reused]
+        for group, result in zip(job.groups, results or itertools.repeat(None)):
+            missing, deferred, codes = group["missing"], group["deferred"], group["codes"]
+            if len(missing):
+                codes[missing] = char_codes[result]
+                if block_cache is not None:
+                    block_cache.insert(group["digests"][missing], codes[missing])
+            if len(deferred):
+                found, values = block_cache.lookup(group["digests"][deferred], count=False)
+                codes[deferred] = values
+                if not found.all():
+                    # evicted before this frame got to them
+                    lost = deferred[~found]
+                    blocks = group["deferred_blocks"][~found]
+                    codes[lost] = char_codes[unify.match_blocks(blocks, job.engine, save_chars, None, index, probes)]
+                    block_cache.insert(group["digests"][lost], codes[lost])
+            region = code_grid[group["row"]:group["row"] + group["n_rows"], group["col"]:group["col"] + group["n_cols"]]
+            if group["changed"] is None:
+                region[...] = codes[group["inverse"]].reshape(group["n_rows"], group["n_cols"])
+            else:
+                region[np.unravel_index(group["changed"], region.shape)] = codes[group["inverse"].ravel()]
+    return code_grid
+
+def process_frame(
+    img, char_aspect, scale, engine, color, invert, stretch_contrast, 
+    save_blocks, start_char, end_char, save_chars, font, 
+    single_threaded, show_progress=False, 
+    executor=None, block_cache=None, characters=None, index="exhaustive",
+    probes=unify.ANN_PROBES, index_report=None, cell=None, use_atlas=True, frame_ring=None,
+    color_depth="truecolor", reference=None, analytic=None, dither="none"
+):
+    job = prepare_frame(
+        img, char_aspect, scale, engine, color, invert, stretch_contrast, save_blocks,
+        start_char, end_char, block_cache, characters, cell, color_depth=color_depth, reference=reference,
+        analytic=analytic, dither=dither
+    )
+    if job.n_missing and index_report is not None and not index_report:
+        init_worker(job.characters, font, use_atlas)
+        index_report.extend(measure_index(job.missing_blocks(), job.engine, index, probes))
+
+    results = None
+    if job.n_missing and not single_threaded and executor:
+        ring = frame_ring or shm.FrameRing(job.img_arr.nbytes, n_slots=1)
+        try:
+            results = collect_results(submit_frame(job, executor, ring, save_chars, index, probes))
+        finally:
+            if ring is not frame_ring:
+                ring.close()
+    elif job.n_missing:
+        init_worker(job.characters, font, use_atlas)
+        results = match_frame(job, save_chars, index, probes, show_progress)
+
+    return finish_frame(job, results, block_cache, save_chars, index, probes)
+
+def process(*args, **kwargs):
+    """Renders an image to the text printed to the terminal, see process_frame."""
+    return str(process_frame(*args, **kwargs))
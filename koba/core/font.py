@@ -1,7 +1,6 @@
 # TODO: dont depend on matplotlib
 
-import matplotlib.font_manager as fm
-from fontTools.ttLib import TTFont
+import os
 
 # cache for font paths and codepoints
 _font_paths = None
@@ -10,15 +9,42 @@ _font_codepoints = {}
 def get_all_font_paths():
     global _font_paths
     if _font_paths is None:
+        import matplotlib.font_manager as fm
         _font_paths = [f.fname for f in fm.fontManager.ttflist]
     return _font_paths
 
 def get_monospace_font():
+    import matplotlib.font_manager as fm
     for font in fm.fontManager.ttflist:
         if "dejavusansmono" in font.name.replace(" ", "").lower():
             return font.fname
     return None
 
+def get_default_font():
+    """
+    get_monospace_font, remembered in the user cache directory so that
+    matplotlib's font list is only loaded while the path is unknown.
+    """
+    from koba.core import atlas
+    path_file = os.path.join(atlas.cache_dir(), "default-font.txt")
+    try:
+        with open(path_file) as f:
+            font_path = f.read().strip()
+        if os.path.exists(font_path):
+            return font_path
+    except OSError:
+        pass
+
+    font_path = get_monospace_font()
+    if font_path:
+        try:
+            os.makedirs(os.path.dirname(path_file), exist_ok=True)
+            with open(path_file, "w") as f:
+                f.write(font_path)
+        except OSError:
+            pass
+    return font_path
+
 def get_supported_font(char):
     codepoint = ord(char)
     for font_path in get_all_font_paths():
@@ -29,6 +55,7 @@ def get_supported_font(char):
 def font_supports_codepoint(font_path, codepoint):
     if font_path not in _font_codepoints:
         try:
+            from fontTools.ttLib import TTFont
             font = TTFont(font_path)
             cps = set()
             for cmap in font['cmap'].tables:
@@ -0,0 +1,51 @@
+import numpy as np
+
+from koba.core import ansi
+
+class Frame:
+    """
+    A rendered frame: a (rows, cols) grid of code points and, in color
+    mode, a color grid of the given depth (see ansi.quantize): RGB values
+    for truecolor, palette indices otherwise. str() gives the text that is
+    printed to the terminal.
+    """
+
+    def __init__(self, codes, colors=None, depth=24):
+        self.codes = codes
+        self.colors = colors
+        self.depth = depth
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    def segment(self, row, start=0, end=None):
+        """The text of the cells row[start:end], colored in color mode."""
+        codes = np.ascontiguousarray(self.codes[row, start:end])
+        if not len(codes):
+            return ""
+        # a row of code points reads directly as one unicode string
+        text = codes.view(f"U{len(codes)}")[0]
+        if self.colors is None:
+            return text
+        return ansi.colorize(text, self.colors[row, start:end], self.depth)
+
+    def __str__(self):
+        return "\n".join(self.segment(row) for row in range(self.shape[0]))
+
+    def to_bytes(self):
+        rows, cols = self.shape
+        header = np.array([rows, cols, 0 if self.colors is None else self.depth], dtype=np.uint32).tobytes()
+        colors = b"" if self.colors is None else self.colors.astype(np.uint8).tobytes()
+        return header + self.codes.astype(np.uint32).tobytes() + colors
+
+    @classmethod
+    def from_bytes(cls, data):
+        rows, cols, depth = (int(value) for value in np.frombuffer(data, dtype=np.uint32, count=3))
+        n_codes = rows * cols
+        codes = np.frombuffer(data, dtype=np.uint32, count=n_codes, offset=12).reshape(rows, cols)
+        if not depth:
+            return cls(codes)
+        shape = (rows, cols, 3) if depth == 24 else (rows, cols)
+        colors = np.frombuffer(data, dtype=np.uint8, count=int(np.prod(shape)), offset=12 + 4 * n_codes).reshape(shape)
+        return cls(codes, colors, depth)
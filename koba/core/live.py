@@ -0,0 +1,58 @@
+import threading
+
+import numpy as np
+
+from koba.core.video import read_into
+
+# bytes per pixel of the --raw-format choices
+RAW_FORMATS = {"gray": 1, "rgb24": 3}
+
+class LatestFrame:
+    """
+    Raw frames of a fixed size, read from a stream by a background thread.
+    Only the newest frame is kept, so a consumer that cannot keep up skips
+    frames instead of falling behind the source. A frame stays valid until
+    the next one is taken.
+    """
+
+    def __init__(self, stream, size, pixel_format="gray"):
+        width, height = size
+        shape = (height, width) if RAW_FORMATS[pixel_format] == 1 else (height, width, RAW_FORMATS[pixel_format])
+        # one buffer being read, one holding the newest frame and one held by the consumer
+        self.buffers = [np.empty(shape, dtype=np.uint8) for _ in range(3)]
+        self.condition = threading.Condition()
+        self.latest = None
+        self.held = None
+        self.done = False
+        self.received = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._read, args=(stream,), name="koba-live", daemon=True)
+        self.thread.start()
+
+    def _read(self, stream):
+        try:
+            while True:
+                with self.condition:
+                    index = next(i for i in range(3) if i != self.latest and i != self.held)
+                if not read_into(stream, self.buffers[index]):
+                    return
+                with self.condition:
+                    if self.latest is not None:
+                        self.dropped += 1
+                    self.latest = index
+                    self.received += 1
+                    self.condition.notify()
+        finally:
+            with self.condition:
+                self.done = True
+                self.condition.notify()
+
+    def __iter__(self):
+        while True:
+            with self.condition:
+                while self.latest is None and not self.done:
+                    self.condition.wait()
+                if self.latest is None:
+                    return
+                self.held, self.latest = self.latest, None
+            yield self.buffers[self.held]
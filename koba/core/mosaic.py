@@ -0,0 +1,90 @@
+import numpy as np
+
+# character ranges of the renderers, see --analytic
+RANGES = {
+    "braille": (10240, 10495),
+    "blocks": (9600, 9631),
+}
+
+# Bayer matrix size of every --dither setting
+DITHERS = {"none": 0, "bayer2": 2, "bayer4": 4, "bayer8": 8}
+
+# bit of the Braille dot in every (row, column) of the 2x4 cell
+BRAILLE_BITS = np.array([[0x01, 0x08], [0x02, 0x10], [0x04, 0x20], [0x40, 0x80]], dtype=np.uint32)
+
+# quadrant characters by their lit quadrants, upper left 1, upper right 2, lower left 4, lower right 8
+QUADRANTS = np.array([
+    0x20, 0x2598, 0x259D, 0x2580, 0x2596, 0x258C, 0x259E, 0x259B,
+    0x2597, 0x259A, 0x2590, 0x259C, 0x2584, 0x2599, 0x259F, 0x2588,
+], dtype=np.uint32)
+QUADRANT_BITS = np.array([[1, 2], [4, 8]], dtype=np.uint32)
+
+# lower eighth blocks by the number of lit eighths
+EIGHTHS = np.array([0x20] + list(range(0x2581, 0x2589)), dtype=np.uint32)
+
+def bayer(size):
+    """Ordered dither matrix of size x size (a power of two), values 0 to size**2 - 1."""
+    matrix = np.zeros((1, 1), dtype=np.int32)
+    while len(matrix) < size:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+    return matrix
+
+def thresholds(shape, dither):
+    """Gray level each sub-cell of a (rows, columns) grid is lit from."""
+    if not dither:
+        return np.full(shape, 128.0)
+    matrix = (bayer(dither) + 0.5) * 256 / dither ** 2
+    return np.tile(matrix, (-(-shape[0] // dither), -(-shape[1] // dither)))[:shape[0], :shape[1]]
+
+def sub_cell_means(img_arr, block_widths, block_heights, columns, rows):
+    """
+    Means of a rows x columns grid of sub-cells in every block, as one
+    (block rows * rows, block columns * columns) array.
+    """
+    def starts(sizes, cells):
+        sizes = np.asarray(sizes)
+        block_starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        return (block_starts[:, None] + np.arange(cells) * sizes[:, None] // cells).ravel()
+
+    y_starts, x_starts = starts(block_heights, rows), starts(block_widths, columns)
+    sums = np.add.reduceat(np.add.reduceat(img_arr, y_starts, axis=0, dtype=np.uint32), x_starts, axis=1)
+    areas = np.outer(np.diff(y_starts, append=img_arr.shape[0]), np.diff(x_starts, append=img_arr.shape[1]))
+    return sums / np.maximum(areas, 1)
+
+def braille_codes(img_arr, block_widths, block_heights, dither=0):
+    """Braille code points that light the dots of the 2x4 sub-cells brighter than their threshold."""
+    means = sub_cell_means(img_arr, block_widths, block_heights, 2, 4)
+    lit = means >= thresholds(means.shape, dither)
+    cells = lit.reshape(len(block_heights), 4, len(block_widths), 2)
+    return 0x2800 + np.einsum("rycx,yx->rc", cells, BRAILLE_BITS).astype(np.uint32)
+
+def block_codes(img_arr, block_widths, block_heights, dither=0):
+    """
+    Block element code points: the thresholded 2x2 quadrants, or the lower
+    eighths of a 1x8 column where those are closer to the block. Dithered
+    frames only use the quadrants, the dither pattern would be lost otherwise.
+    """
+    rows, cols = len(block_heights), len(block_widths)
+    quadrant_means = sub_cell_means(img_arr, block_widths, block_heights, 2, 2)
+    lit = quadrant_means >= thresholds(quadrant_means.shape, dither)
+    quadrants = lit.reshape(rows, 2, cols, 2)
+    quadrant_codes = QUADRANTS[np.einsum("rycx,yx->rc", quadrants, QUADRANT_BITS)]
+    if dither:
+        return quadrant_codes
+    quadrant_error = np.abs(quadrant_means - 255.0 * lit).reshape(rows, 2, cols, 2).mean(axis=(1, 3))
+
+    # error of every number of lit eighths, counted from the bottom
+    eighth_means = sub_cell_means(img_arr, block_widths, block_heights, 1, 8).reshape(rows, 8, cols)[:, ::-1]
+    lit_error = np.cumsum(255.0 - eighth_means, axis=1)
+    unlit_error = np.cumsum(eighth_means[:, ::-1], axis=1)[:, ::-1]
+    zeros = np.zeros((rows, 1, cols))
+    errors = np.concatenate((zeros, lit_error), axis=1) + np.concatenate((unlit_error, zeros), axis=1)
+    eighths = errors.argmin(axis=1)
+    eighth_error = errors.min(axis=1) / 8
+
+    return np.where(eighth_error < quadrant_error, EIGHTHS[eighths], quadrant_codes)
+
+def code_grid(renderer, img_arr, block_widths, block_heights, dither="none"):
+    """The code points of a frame, computed by the renderer instead of matched."""
+    render = braille_codes if renderer == "braille" else block_codes
+    return render(img_arr, block_widths, block_heights, DITHERS[dither])
@@ -0,0 +1,148 @@
+import queue
+import threading
+import collections
+
+import numpy as np
+
+from koba import timing
+from koba.core import core, unify
+
+# frames matched by the worker pool at the same time
+PIPELINE_DEPTH = 4
+
+_DONE = object()
+
+class Prefetch:
+    """
+    Iterates over items that a background thread produces up to size items
+    ahead of the consumer. Errors of the producer are raised in the consuming
+    thread, close stops the producer.
+    """
+
+    def __init__(self, items, size, name="koba-prefetch"):
+        self.queue = queue.Queue(maxsize=size)
+        self.stop = threading.Event()
+        self.filled = threading.Event()
+        self.thread = threading.Thread(target=self._produce, args=(items,), name=name, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                self.filled.set()
+        return False
+
+    def _produce(self, items):
+        try:
+            for item in items:
+                if not self._put((item, None)):
+                    break
+                if self.queue.full():
+                    self.filled.set()
+            else:
+                self._put((_DONE, None))
+        except BaseException as e:
+            # SystemExit too, the consumer would wait for the next item forever
+            self._put((_DONE, e))
+        finally:
+            # generators have to be closed by the thread running them
+            if hasattr(items, "close"):
+                items.close()
+            self.filled.set()
+
+    def ready(self):
+        """Whether the next item is produced already."""
+        with self.queue.mutex:
+            return bool(self.queue.queue) and self.queue.queue[0][0] is not _DONE
+
+    def wait_filled(self):
+        """Blocks until the buffer is full or the producer is done."""
+        self.filled.wait()
+
+    def __iter__(self):
+        while True:
+            item, error = self.queue.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+
+def decode_ahead(frames, depth):
+    """Iterates over frames that a background thread decodes up to depth frames ahead."""
+    prefetch = Prefetch(frames, depth, "koba-decode")
+    try:
+        yield from prefetch
+    finally:
+        prefetch.close()
+
+def render_frames(
+    frames, char_aspect, scale, engine, color, invert, stretch_contrast,
+    save_blocks, start_char, end_char, save_chars, font,
+    executor=None, frame_ring=None, block_cache=None, characters=None, index="exhaustive",
+    probes=unify.ANN_PROBES, index_report=None, cell=None, use_atlas=True, depth=PIPELINE_DEPTH,
+    color_depth="truecolor", temporal_threshold=0, analytic=None, dither="none"
+):
+    """
+    Renders a sequence of frames as a pipeline and yields (frame, rendered)
+    tuples in order. A background thread decodes frames, prepare_frame splits
+    and deduplicates them and the worker pool matches the blocks of up to
+    depth frames at once, while finish_frame completes the oldest frame.
+    The frame ring needs at least depth slots. With a temporal_threshold,
+    cells that barely changed keep their character, see core.Reference.
+    """
+    in_flight = collections.deque()
+    reference = core.Reference(temporal_threshold) if temporal_threshold > 0 else None
+
+    def finish(entry):
+        number, frame, job, futures = entry
+        timing.set_frame(number)
+        if futures is not None:
+            results = core.collect_results(futures)
+        elif job.n_missing:
+            results = core.match_frame(job, save_chars, index, probes)
+        else:
+            results = None
+        return frame, core.finish_frame(job, results, block_cache, save_chars, index, probes)
+
+    try:
+        for number, frame in enumerate(decode_ahead(frames, depth)):
+            if len(in_flight) >= (depth if executor else 1):
+                yield finish(in_flight.popleft())
+
+            # blocks an earlier frame is matching already are taken from the cache later
+            pending = np.concatenate([job.digests for _, _, job, _ in in_flight]) if in_flight else None
+            timing.set_frame(number)
+            job = core.prepare_frame(
+                frame, char_aspect, scale, engine, color, invert, stretch_contrast, save_blocks,
+                start_char, end_char, block_cache, characters, cell, pending, color_depth, reference,
+                analytic, dither
+            )
+            if job.n_missing and index_report is not None and not index_report:
+                core.init_worker(job.characters, font, use_atlas)
+                index_report.extend(core.measure_index(job.missing_blocks(), job.engine, index, probes))
+
+            futures = None
+            if executor and job.n_missing:
+                # a larger frame replaces the ring, which the frames in flight still use
+                if job.img_arr.nbytes > frame_ring.slot_bytes:
+                    while in_flight:
+                        yield finish(in_flight.popleft())
+                futures = core.submit_frame(job, executor, frame_ring, save_chars, index, probes)
+            in_flight.append((number, frame, job, futures))
+
+        while in_flight:
+            yield finish(in_flight.popleft())
+    finally:
+        for _, _, _, futures in in_flight:
+            # one list of futures per block shape
+            for group in futures or []:
+                for future in group:
+                    future.cancel()
@@ -0,0 +1,176 @@
+import numpy as np
+
+# engines whose distance is bounded from below by the brightness difference
+BOUND_ENGINES = ("diff", "mse")
+
+# number of glyphs taken from each side of the brightness order per round
+FIRST_ROUND = 4
+
+def max_distance(engine, size):
+    """Distance that maps to a similarity of 0.0 (used for empty glyphs)."""
+    return size * 255 if engine == "diff" else size * 255 ** 2
+
+def pair_distances(blocks, glyphs, engine):
+    """Exact integer distances between matching rows of two (p, n) arrays."""
+    if engine == "diff":
+        distance = np.maximum(blocks, glyphs)
+        distance -= np.minimum(blocks, glyphs)
+        return distance.sum(axis=1, dtype=np.int64)
+    delta = blocks.astype(np.int32) - glyphs.astype(np.int32)
+    return np.einsum("ij,ij->i", delta, delta, dtype=np.int64)
+
+def bound_search(blocks, glyph_stack, engine):
+    """
+    Exact branch-and-bound search for the best glyph of every block.
+
+    Glyphs are visited in order of brightness, starting next to the block's
+    own brightness and walking outwards on both sides. The brightness
+    difference is a lower bound for diff and mse, so a side is abandoned as
+    soon as its next glyph can no longer beat the best match, and for mse
+    single glyphs are skipped if their norm already rules them out.
+    Ties resolve to the lowest glyph index, like the exhaustive search.
+
+    Returns the best glyph index per block and the number of scored pairs.
+    """
+    if engine not in BOUND_ENGINES:
+        raise ValueError(f"Branch and bound search does not support engine {engine}.")
+
+    count = len(blocks)
+    n_glyphs = len(glyph_stack)
+    size = glyph_stack.size
+    blocks = blocks.reshape(count, -1)
+    glyphs = glyph_stack.glyphs.reshape(n_glyphs, -1)
+    order = glyph_stack.brightness_order
+    sorted_sums = glyph_stack.sums[order]
+    empty_distance = max_distance(engine, size)
+
+    block_sums = blocks.sum(axis=1, dtype=np.int64)
+    if engine == "mse":
+        block_norms = np.sqrt((blocks.astype(np.int64) ** 2).sum(axis=1))
+
+    # best match packed as distance * n_glyphs + index, so ties prefer lower indices;
+    # no glyph can be further away than empty_distance
+    best = np.full(count, (empty_distance + 1) * n_glyphs, dtype=np.int64)
+    right = np.searchsorted(sorted_sums, block_sums)
+    left = right - 1
+    scored = 0
+
+    step = FIRST_ROUND
+    while True:
+        best_distance = best // n_glyphs
+        candidate_rows = []
+        candidate_positions = []
+        for side, direction in ((left, -1), (right, 1)):
+            rows = np.nonzero((side >= 0) & (side < n_glyphs))[0]
+            rows = rows[~_exceeds(sorted_sums[side[rows]], block_sums[rows], best_distance[rows], engine, size)]
+            # closed sides stay closed, the bound only grows further out
+            closed = np.ones(count, dtype=bool)
+            closed[rows] = False
+            side[closed] = -1
+
+            positions = side[rows, None] + direction * np.arange(step)
+            in_range = (positions >= 0) & (positions < n_glyphs)
+            candidate_rows.append(np.broadcast_to(rows[:, None], positions.shape)[in_range])
+            candidate_positions.append(positions[in_range])
+            side[rows] += direction * step
+
+        rows = np.concatenate(candidate_rows)
+        if not len(rows):
+            break
+        positions = np.concatenate(candidate_positions)
+
+        keep = ~_exceeds(sorted_sums[positions], block_sums[rows], best_distance[rows], engine, size)
+        if engine == "mse":
+            glyph_norms = glyph_stack.norms[order[positions]]
+            norm_gap = np.abs(block_norms[rows] - glyph_norms)
+            # small slack keeps the float bound below the exact distance
+            norm_gap = np.maximum(0.0, norm_gap - 1e-9 * (block_norms[rows] + glyph_norms))
+            keep &= norm_gap * norm_gap <= best_distance[rows]
+        rows = rows[keep]
+        glyph_ids = order[positions[keep]]
+
+        distances = pair_distances(blocks[rows], glyphs[glyph_ids], engine)
+        distances[~glyph_stack.valid[glyph_ids]] = empty_distance
+        np.minimum.at(best, rows, distances * n_glyphs + glyph_ids)
+        scored += len(rows)
+        step *= 2
+
+    return best % n_glyphs, scored
+
+def _exceeds(glyph_sums, block_sums, best_distance, engine, size):
+    """True where the brightness bound already rules a glyph out."""
+    delta = np.abs(glyph_sums - block_sums)
+    if engine == "diff":
+        return delta > best_distance
+    # mse distance >= (sum difference)^2 / size, compared without rounding
+    return delta * delta > best_distance * size
+
+class AnnIndex:
+    """
+    Approximate nearest-glyph index for one glyph stack.
+
+    Glyphs are projected onto their first principal components and grouped
+    with k-means. A query only scores the glyphs of the clusters closest to
+    the block, so the cost depends on the probed clusters instead of the
+    size of the character range.
+    """
+
+    def __init__(self, glyph_stack, engine, dimensions=16, n_clusters=None, iterations=10, seed=0):
+        self.engine = engine
+        vectors = self.transform(glyph_stack.glyphs.reshape(len(glyph_stack), -1))
+
+        # principal components from the (pixels x pixels) covariance matrix
+        self.center = vectors.mean(axis=0)
+        centered = vectors - self.center
+        _, eigenvectors = np.linalg.eigh(centered.T @ centered)
+        dimensions = max(1, min(dimensions, vectors.shape[1], len(vectors)))
+        self.components = eigenvectors[:, ::-1][:, :dimensions].astype(np.float32)
+        points = centered @ self.components
+
+        if n_clusters is None:
+            n_clusters = int(np.sqrt(len(points)))
+        n_clusters = max(1, min(n_clusters, len(points)))
+        rng = np.random.default_rng(seed)
+        centroids = points[rng.choice(len(points), n_clusters, replace=False)]
+        for _ in range(iterations):
+            labels = _nearest(points, centroids, 1)[:, 0]
+            for cluster in range(n_clusters):
+                members = points[labels == cluster]
+                if len(members):
+                    centroids[cluster] = members.mean(axis=0)
+        labels = _nearest(points, centroids, 1)[:, 0]
+
+        used = np.unique(labels)
+        self.centroids = centroids[used]
+        # member indices are sorted, so ties inside a cluster keep the lowest glyph index
+        self.members = [np.nonzero(labels == cluster)[0] for cluster in used]
+        self.stacks = [glyph_stack.take(members) for members in self.members]
+
+    def __len__(self):
+        return len(self.members)
+
+    def transform(self, vectors):
+        """Maps flattened images into the space the index is built in."""
+        vectors = vectors.astype(np.float32)
+        if self.engine == "ncc":
+            vectors -= vectors.mean(axis=1, keepdims=True)
+        if self.engine in ("ncc", "cosine"):
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1.0, norms)
+        return vectors
+
+    def probe(self, blocks, probes):
+        """Indices of the `probes` clusters closest to every block."""
+        points = (self.transform(blocks.reshape(len(blocks), -1)) - self.center) @ self.components
+        return _nearest(points, self.centroids, min(probes, len(self)))
+
+def _nearest(points, centroids, k):
+    """Indices of the k closest centroids for every point."""
+    distances = (
+        (points * points).sum(axis=1)[:, None]
+        - 2 * points @ centroids.T
+        + (centroids * centroids).sum(axis=1)[None]
+    )
+    if k >= distances.shape[1]:
+        return np.argsort(distances, axis=1)
+    return np.argpartition(distances, k - 1, axis=1)[:, :k]
@@ -0,0 +1,75 @@
+import threading
+import contextlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# segments attached by this (worker) process and their number of readers, by name
+_attached = {}
+# the segment attached last, older ones belong to rings that were replaced
+_newest = None
+_lock = threading.Lock()
+
+class FrameRing:
+    """
+    Ring buffer of frame slots in one shared memory segment. Frames are
+    written once by the main process; workers map the same pages by name,
+    so only slot numbers and block coordinates have to be pickled.
+    """
+
+    def __init__(self, slot_bytes, n_slots=2):
+        self.slot_bytes = max(1, int(slot_bytes))
+        self.n_slots = n_slots
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * n_slots)
+        self.next_slot = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def ensure(self, nbytes):
+        """Grows the slots if a frame does not fit, which gives the ring a new name."""
+        if nbytes > self.slot_bytes:
+            self.close()
+            self.__init__(nbytes, self.n_slots)
+
+    def write(self, arr):
+        """Copies a frame into the next slot and returns the slot number."""
+        self.ensure(arr.nbytes)
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.n_slots
+        view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        view[...] = arr
+        return slot
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+def _evict():
+    """Detaches the segments of replaced rings that no reader is using."""
+    for name, (segment, readers) in list(_attached.items()):
+        if name != _newest and not readers:
+            del _attached[name]
+            segment.close()
+
+@contextlib.contextmanager
+def read_slot(name, slot_bytes, slot, shape, dtype=np.uint8):
+    """
+    Maps a frame of a ring, attaching to its segment on first use. The
+    frame is only valid inside the with block, views must not outlive it.
+    """
+    global _newest
+    with _lock:
+        if name not in _attached:
+            _attached[name] = [shared_memory.SharedMemory(name=name), 0]
+            _newest = name
+            _evict()
+        entry = _attached[name]
+        entry[1] += 1
+    try:
+        yield np.ndarray(shape, dtype=dtype, buffer=entry[0].buf, offset=slot * slot_bytes)
+    finally:
+        with _lock:
+            entry[1] -= 1
+            _evict()
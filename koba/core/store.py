@@ -0,0 +1,107 @@
+import os
+import json
+import mmap
+import shutil
+import hashlib
+import zlib
+
+import numpy as np
+
+from koba import __version__
+from koba.core.frame import Frame
+
+# version of the frame encoding in frames.bin
+FORMAT = 3
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def render_key(path, options):
+    """Cache key for a file rendered with the options that affect its output."""
+    key = {"file": file_digest(path), "options": options, "version": __version__}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:32]
+
+class FrameStore:
+    """
+    Finished frames of one rendering in a single directory: zlib-compressed
+    frame grids (see Frame.to_bytes) appended to frames.bin, their offsets in index.npy and the
+    frame delays and media type in meta.json. A store is written to a
+    ".partial" directory first and only becomes visible once it is complete.
+    Complete stores are memory-mapped and decompress frames on access.
+    """
+
+    def __init__(self, path, index, meta):
+        self.path = path
+        self.index = index
+        self.delays = meta["delays"]
+        self.media_type = meta["media_type"]
+        self.data = b""
+        with open(os.path.join(path, "frames.bin"), "rb") as f:
+            # empty files can not be memory-mapped
+            if os.fstat(f.fileno()).st_size:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def load(cls, path):
+        """Opens a complete store, or returns None if there is none."""
+        try:
+            index = np.load(os.path.join(path, "index.npy"), mmap_mode="r")
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            if meta.get("format") != FORMAT:
+                return None
+            return cls(path, index, meta)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        offset, length = self.index[i]
+        return Frame.from_bytes(zlib.decompress(self.data[offset:offset + length]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class FrameStoreWriter:
+    """Appends frames to a new FrameStore."""
+
+    def __init__(self, path, media_type, level=6):
+        self.path = path
+        self.partial_path = path + ".partial"
+        self.media_type = media_type
+        self.level = level
+        shutil.rmtree(self.partial_path, ignore_errors=True)
+        os.makedirs(self.partial_path)
+        self.file = open(os.path.join(self.partial_path, "frames.bin"), "wb")
+        self.offsets = []
+        self.delays = []
+        self.offset = 0
+
+    def append(self, frame, delay):
+        blob = zlib.compress(frame.to_bytes(), self.level)
+        self.file.write(blob)
+        self.offsets.append((self.offset, len(blob)))
+        self.delays.append(delay)
+        self.offset += len(blob)
+
+    def finish(self):
+        """Completes the store and returns it opened for reading."""
+        self.file.close()
+        np.save(os.path.join(self.partial_path, "index.npy"), np.array(self.offsets, dtype=np.int64).reshape(-1, 2))
+        with open(os.path.join(self.partial_path, "meta.json"), "w") as f:
+            json.dump({"delays": self.delays, "media_type": self.media_type, "format": FORMAT}, f)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.partial_path, self.path)
+        return FrameStore.load(self.path)
+
+    def discard(self):
+        self.file.close()
+        shutil.rmtree(self.partial_path, ignore_errors=True)
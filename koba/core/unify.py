@@ -1,17 +1,207 @@
+import time
+import logging
+from functools import cached_property
+
 from PIL import Image
-from skimage.metrics import structural_similarity as ssim
 import numpy as np
 
-from ._unify_shared import get_char, pre_render_characters, crop_image, get_font, font_path
-from . import _unify_optim
+from koba import timing
+from ._unify_shared import get_char, pre_render_characters, crop_image, get_font
+from . import _unify_optim, _unify_shared, atlas, search
 
 WORKER_CHARACTERS = None
 
+# engines that can score a whole batch of blocks against a glyph stack at once
+VECTORIZED_ENGINES = ("diff", "mse", "brightness", "ncc", "cosine", "ssim")
+
+# constants used by skimage.metrics.structural_similarity
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+SSIM_DATA_RANGE = 255.0
+
+# clusters scored per block by the ann index, more probes trade speed for recall
+ANN_PROBES = 4
+
+# glyph stacks are read from the shared on-disk atlas unless this is disabled
+USE_ATLAS = True
+
+# OpenMP threads used by the native batch kernels; worker processes keep one
+# thread each so that a process pool does not oversubscribe the cores
+KERNEL_THREADS = 1
+
+# engines where even a single-threaded kernel beats the BLAS-backed NumPy path
+KERNEL_FIRST_ENGINES = ("diff", "brightness")
+
+# upper bound for the number of (block, glyph, pixel) elements scored at once
+BATCH_ELEMENTS = 1 << 24
+
+_glyph_stacks = {}
+
+def set_kernel_threads(threads):
+    """Set how many threads the native batch kernels may use."""
+    global KERNEL_THREADS
+    KERNEL_THREADS = max(1, threads)
+
+def set_glyph_source(font=None, use_atlas=True):
+    """Set the main font and whether glyph stacks come from the on-disk atlas."""
+    global USE_ATLAS
+    if font and font != _unify_shared.font_path:
+        _unify_shared.set_font_path(font)
+        _glyph_stacks.clear()
+    USE_ATLAS = use_atlas
+
 def set_worker_characters(characters):
     """Set the character list for the worker process."""
     global WORKER_CHARACTERS
+    if characters != WORKER_CHARACTERS:
+        _glyph_stacks.clear()
     WORKER_CHARACTERS = characters
 
+class GlyphStack:
+    """All rendered glyphs of one block shape, stacked into a (n, h, w) array."""
+
+    def __init__(self, characters, width, height, save_chars=False, progress_callback=None):
+        self.characters = characters
+        self.width = width
+        self.height = height
+        # glyphs without visible pixels always score 0.0, like in compare_character
+        if USE_ATLAS and not save_chars:
+            self.glyphs, self.valid = atlas.load_atlas(characters, width, height, progress_callback)
+        else:
+            self.glyphs, self.valid = _unify_shared.render_glyphs(
+                characters, width, height, save_chars, progress_callback
+            )
+
+        flat = self.glyphs.reshape(len(characters), -1).astype(np.int64)
+        self.size = width * height
+        self.sums = flat.sum(axis=1)
+        self.sq_sums = (flat * flat).sum(axis=1)
+        self.means = self.sums / self.size
+        self.norms = np.sqrt(self.sq_sums)
+
+    def __len__(self):
+        return len(self.characters)
+
+    def take(self, indices):
+        """A glyph stack holding only the glyphs at the given indices."""
+        subset = object.__new__(GlyphStack)
+        subset.characters = [self.characters[i] for i in indices]
+        subset.width = self.width
+        subset.height = self.height
+        subset.size = self.size
+        for name in ("glyphs", "valid", "sums", "sq_sums", "means", "norms"):
+            setattr(subset, name, getattr(self, name)[indices])
+        return subset
+
+    def best_glyphs(self, blocks, engine, threads=1):
+        """Best glyph index per block, computed by the native batch kernel."""
+        return _unify_optim.best_glyphs(
+            self.glyphs.reshape(len(self), -1), self.valid.view(np.uint8),
+            self.means, self.stds, self.norms,
+            np.ascontiguousarray(blocks.reshape(len(blocks), -1)), engine, threads
+        )
+
+    def ann_index(self, engine):
+        """Approximate nearest-glyph index for an engine, built on first use."""
+        if not hasattr(self, "_ann_indexes"):
+            self._ann_indexes = {}
+        if engine not in self._ann_indexes:
+            self._ann_indexes[engine] = search.AnnIndex(self, engine)
+        return self._ann_indexes[engine]
+
+    @cached_property
+    def brightness_order(self):
+        """Glyph indices sorted by mean brightness, used by the bound search."""
+        return np.argsort(self.sums, kind="stable")
+
+    @cached_property
+    def flat(self):
+        return self.glyphs.reshape(len(self), -1).astype(np.float64)
+
+    @cached_property
+    def stds(self):
+        return self.flat.std(axis=1)
+
+    @cached_property
+    def normalized(self):
+        """Zero-mean, unit-variance glyphs (zero rows for flat glyphs)."""
+        stds = np.where(self.stds == 0, 1.0, self.stds)
+        return (self.flat - self.means[:, None]) / stds[:, None]
+
+    @cached_property
+    def ssim_stats(self):
+        """Windowed means and variances of every glyph, computed once per shape."""
+        win_size = ssim_win_size(self.height, self.width)
+        glyphs = self.glyphs.astype(np.float64)
+        means = window_means(glyphs, win_size)
+        variances = window_means(glyphs * glyphs, win_size) - means * means
+        return glyphs, means, variances
+
+def ssim_win_size(height, width):
+    """Window size used for ssim, picked the same way as in compare_character."""
+    win_size = min(7, height, width)
+    if win_size % 2 == 0:
+        win_size -= 1
+    if win_size < 3:
+        win_size = 3
+    return win_size
+
+def window_means(arr, win_size):
+    """
+    Means of every win_size x win_size window that lies fully inside the
+    last two axes of arr, computed with summed-area tables.
+    """
+    table = np.zeros(arr.shape[:-2] + (arr.shape[-2] + 1, arr.shape[-1] + 1))
+    np.cumsum(arr, axis=-2, out=table[..., 1:, 1:])
+    np.cumsum(table[..., 1:, 1:], axis=-1, out=table[..., 1:, 1:])
+    sums = (
+        table[..., win_size:, win_size:] - table[..., :-win_size, win_size:]
+        - table[..., win_size:, :-win_size] + table[..., :-win_size, :-win_size]
+    )
+    return sums / (win_size * win_size)
+
+def score_ssim(blocks, glyph_stack):
+    """
+    Mean structural similarity of every block against every glyph.
+    Matches skimage's structural_similarity with uniform windows and
+    sample covariance, which only keeps windows fully inside the image.
+    """
+    height, width = blocks.shape[1:]
+    win_size = ssim_win_size(height, width)
+    if win_size > min(height, width):
+        return np.zeros((len(blocks), len(glyph_stack)))
+
+    cov_norm = win_size ** 2 / (win_size ** 2 - 1)
+    c1 = (SSIM_K1 * SSIM_DATA_RANGE) ** 2
+    c2 = (SSIM_K2 * SSIM_DATA_RANGE) ** 2
+
+    glyphs, glyph_means, glyph_variances = glyph_stack.ssim_stats
+    x = blocks.astype(np.float64)
+    block_means = window_means(x, win_size)
+    block_variances = window_means(x * x, win_size) - block_means * block_means
+
+    # covariance terms for all (block, glyph) pairs in one batched filter
+    products = window_means(x[:, None] * glyphs[None], win_size)
+    ux = block_means[:, None]
+    uy = glyph_means[None]
+    vxy = cov_norm * (products - ux * uy)
+    vx = cov_norm * block_variances[:, None]
+    vy = cov_norm * glyph_variances[None]
+
+    s = ((2 * ux * uy + c1) * (2 * vxy + c2)) / ((ux * ux + uy * uy + c1) * (vx + vy + c2))
+    return np.maximum(0.0, s.mean(axis=(2, 3)))
+
+def get_glyph_stack(width, height, save_chars=False, progress_callback=None):
+    """Returns the cached glyph stack of WORKER_CHARACTERS for one block shape."""
+    if WORKER_CHARACTERS is None:
+        raise ValueError("Worker characters have not been initialized.")
+    stack = _glyph_stacks.get((width, height))
+    if stack is None:
+        with timing.stage("glyph stacks"):
+            stack = GlyphStack(WORKER_CHARACTERS, width, height, save_chars, progress_callback)
+        _glyph_stacks[(width, height)] = stack
+    return stack
+
 def compare_character(char, block_arr, save_chars, engine):
     if engine in ("diff", "brightness"):
         return _unify_optim.compare_character(char, block_arr, save_chars, engine)
@@ -40,6 +230,8 @@ def compare_character(char, block_arr, save_chars, engine):
         if win_size < 3:
             win_size = 3
         
+        # scikit-image is only needed by this reference path
+        from skimage.metrics import structural_similarity as ssim
         try:
             score = ssim(block_arr, char_arr, data_range=255, win_size=win_size)
             if isinstance(score, tuple):
@@ -118,10 +310,175 @@ def get_character(img_arr, engine, save_chars):
     
     return best_match
 
-def process_blocks_batch(blocks_batch, engine, save_chars):
-    """Processes a batch of blocks and returns a result map."""
-    results_map = {}
-    for block in blocks_batch:
-        results_map[block.tobytes()] = get_character(block, engine, save_chars)
-    return results_map
+def score_blocks(blocks, glyph_stack, engine):
+    """
+    Scores a (b, h, w) batch of same-shape blocks against every glyph
+    of a GlyphStack and returns a (b, n_glyphs) similarity matrix.
+    """
+    n = glyph_stack.size
+    if engine == "ssim":
+        similarity = score_ssim(blocks, glyph_stack)
+        similarity[:, ~glyph_stack.valid] = 0.0
+        return similarity
+
+    blocks = blocks.reshape(len(blocks), -1)
+
+    if engine == "diff":
+        # |a - b| == max(a, b) - min(a, b) stays within uint8
+        a = blocks[:, None, :]
+        b = glyph_stack.glyphs.reshape(len(glyph_stack), -1)[None]
+        pixel_diff = np.maximum(a, b)
+        pixel_diff -= np.minimum(a, b)
+        pixel_diff = pixel_diff.sum(axis=2, dtype=np.int64)
+        similarity = 1.0 - pixel_diff / float(n * 255)
+    elif engine == "mse":
+        # all terms are integers below 2**53, so the float products are exact
+        a = blocks.astype(np.float64)
+        sq_sums = (a * a).sum(axis=1)
+        squared_error = sq_sums[:, None] - 2 * (a @ glyph_stack.flat.T) + glyph_stack.sq_sums[None]
+        similarity = 1.0 - (squared_error / n) / (255.0 ** 2)
+    elif engine == "brightness":
+        means = blocks.sum(axis=1, dtype=np.int64) / n
+        similarity = 1.0 - np.abs(glyph_stack.means[None] - means[:, None]) / 255.0
+    elif engine == "ncc":
+        a = blocks.astype(np.float64)
+        means = a.mean(axis=1)
+        stds = a.std(axis=1)
+        a = (a - means[:, None]) / np.where(stds == 0, 1.0, stds)[:, None]
+        similarity = ((a @ glyph_stack.normalized.T) / n + 1) / 2
+
+        flat_blocks = stds[:, None] == 0
+        flat_glyphs = glyph_stack.stds[None] == 0
+        same_mean = means[:, None] == glyph_stack.means[None]
+        similarity = np.where(flat_blocks | flat_glyphs, 0.0, similarity)
+        similarity = np.where(flat_blocks & flat_glyphs & same_mean, 1.0, similarity)
+    elif engine == "cosine":
+        a = blocks.astype(np.float64)
+        norms = np.sqrt((a * a).sum(axis=1))
+        denominator = norms[:, None] * glyph_stack.norms[None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarity = ((a @ glyph_stack.flat.T) / denominator + 1) / 2
+
+        black_blocks = norms[:, None] == 0
+        black_glyphs = glyph_stack.norms[None] == 0
+        similarity = np.where(black_blocks | black_glyphs, 0.0, similarity)
+        similarity = np.where(black_blocks & black_glyphs, 1.0, similarity)
+    else:
+        raise ValueError(f"Engine {engine} can not be used for batch scoring.")
+
+    similarity[:, ~glyph_stack.valid] = 0.0
+    return similarity
+
+def search_ann(blocks, glyph_stack, engine, probes):
+    """
+    Scores every block only against the glyphs of its closest index
+    clusters and returns the best glyph index per block.
+    """
+    ann = glyph_stack.ann_index(engine)
+    nearest = ann.probe(blocks, probes)
+    best_scores = np.full(len(blocks), -np.inf)
+    best = np.zeros(len(blocks), dtype=np.intp)
+    for cluster in np.unique(nearest):
+        rows = np.nonzero((nearest == cluster).any(axis=1))[0]
+        scores = score_blocks(blocks[rows], ann.stacks[cluster], engine)
+        choice = scores.argmax(axis=1)
+        cluster_scores = scores[np.arange(len(rows)), choice]
+        glyph_ids = ann.members[cluster][choice]
+        better = (cluster_scores > best_scores[rows]) | (
+            (cluster_scores == best_scores[rows]) & (glyph_ids < best[rows])
+        )
+        best_scores[rows[better]] = cluster_scores[better]
+        best[rows[better]] = glyph_ids[better]
+    return best
+
+def get_glyph_indices(blocks, engine, save_chars, progress_callback=None, index="exhaustive", probes=ANN_PROBES):
+    """
+    Best glyph for every block of a (n, h, w) batch of same-shape blocks,
+    as indices into WORKER_CHARACTERS (None without glyphs).
+    """
+    blocks = np.asarray(blocks)
+    count, height, width = blocks.shape
+    glyph_stack = get_glyph_stack(width, height, save_chars)
+    if not len(glyph_stack):
+        return None
+
+    use_bounds = index == "bnb" and engine in search.BOUND_ENGINES
+    use_kernel = engine in getattr(_unify_optim, "KERNEL_ENGINES", ()) and (
+        KERNEL_THREADS > 1 or engine in KERNEL_FIRST_ENGINES
+    )
+    if index == "exhaustive" and use_kernel:
+        best = glyph_stack.best_glyphs(blocks, engine, KERNEL_THREADS)
+        if progress_callback:
+            progress_callback(count)
+        return best
+
+    chunk_elements = BATCH_ELEMENTS // 8 if engine == "ssim" else BATCH_ELEMENTS
+    chunk_size = max(1, chunk_elements // (len(glyph_stack) * glyph_stack.size))
+    if index == "ann":
+        # only a few clusters are scored per block
+        chunk_size *= max(1, len(glyph_stack.ann_index(engine)) // probes)
+    best = np.empty(count, dtype=np.intp)
+    scored = 0
+    for start in range(0, count, chunk_size):
+        chunk = blocks[start:start + chunk_size]
+        if use_bounds:
+            best[start:start + len(chunk)], chunk_scored = search.bound_search(chunk, glyph_stack, engine)
+            scored += chunk_scored
+        elif index == "ann":
+            best[start:start + len(chunk)] = search_ann(chunk, glyph_stack, engine, probes)
+        else:
+            best[start:start + len(chunk)] = score_blocks(chunk, glyph_stack, engine).argmax(axis=1)
+        if progress_callback:
+            progress_callback(len(chunk))
+
+    if use_bounds:
+        logging.debug(f"Branch and bound scored {scored} of {count * len(glyph_stack)} block/glyph pairs.")
+
+    return best
+
+def match_blocks(blocks, engine, save_chars, progress_callback=None, index="exhaustive", probes=ANN_PROBES):
+    """
+    Best glyph for every block of a (n, h, w) batch of same-shape blocks,
+    as indices into WORKER_CHARACTERS. Works for every engine.
+    """
+    if engine in VECTORIZED_ENGINES:
+        return get_glyph_indices(blocks, engine, save_chars, progress_callback, index, probes)
+
+    positions = {character: i for i, character in enumerate(WORKER_CHARACTERS)}
+    best = np.empty(len(blocks), dtype=np.intp)
+    for i, block in enumerate(blocks):
+        best[i] = positions[get_character(block, engine, save_chars)]
+        if progress_callback:
+            progress_callback(1)
+    return best
+
+def measure_index_accuracy(blocks, engine, index, probes=ANN_PROBES):
+    """
+    Compares an index against the exhaustive search on a batch of same-shape
+    blocks. Returns the share of blocks that got the same glyph, the mean
+    similarity lost on the others and the time both searches took.
+    """
+    blocks = np.asarray(blocks)
+    glyph_stack = get_glyph_stack(blocks.shape[2], blocks.shape[1])
+    if index == "ann":
+        glyph_stack.ann_index(engine)
+
+    start = time.perf_counter()
+    scores = np.concatenate([
+        score_blocks(blocks[i:i + 256], glyph_stack, engine) for i in range(0, len(blocks), 256)
+    ])
+    exact = scores.argmax(axis=1)
+    exhaustive_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    approximate = get_glyph_indices(blocks, engine, False, index=index, probes=probes)
+    index_time = time.perf_counter() - start
 
+    rows = np.arange(len(blocks))
+    return {
+        "blocks": len(blocks),
+        "recall": float(np.mean(exact == approximate)),
+        "similarity_loss": float(np.mean(scores[rows, exact] - scores[rows, approximate])),
+        "exhaustive_time": exhaustive_time,
+        "index_time": index_time,
+    }
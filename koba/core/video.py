@@ -0,0 +1,70 @@
+import subprocess
+
+import numpy as np
+
+from koba import timing
+
+def probe(path):
+    """Returns the (width, height), frame rate and duration of a video."""
+    with timing.span("probe video"):
+        # moviepy is only imported for videos
+        from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+        infos = ffmpeg_parse_infos(path)
+    if not infos.get("video_found"):
+        raise OSError(f"No video stream found in {path}.")
+    return tuple(infos["video_size"]), infos["video_fps"], infos["duration"]
+
+def read_into(stream, buffer):
+    """Fills buffer from a binary stream, returns False at the end of the stream."""
+    view = memoryview(buffer).cast("B")
+    filled = 0
+    while filled < len(view):
+        n = stream.readinto(view[filled:])
+        if not n:
+            return False
+        filled += n
+    return True
+
+class VideoReader:
+    """
+    Frames of a video, decoded by an ffmpeg subprocess that already scales
+    them to size, drops frames above fps and converts them to gray8 or rgb24.
+    Frames are read into a few reused arrays, so a frame stays valid only
+    until buffers - 1 further frames were read.
+    """
+
+    def __init__(self, path, size, fps=None, gray=False, buffers=2):
+        self.path = path
+        self.size = size
+        self.fps = fps
+        self.gray = gray
+        width, height = size
+        shape = (height, width) if gray else (height, width, 3)
+        self.buffers = [np.empty(shape, dtype=np.uint8) for _ in range(buffers)]
+
+    def command(self):
+        from imageio_ffmpeg import get_ffmpeg_exe
+        width, height = self.size
+        filters = f"scale={width}:{height}:flags=area"
+        if self.fps:
+            filters = f"fps={self.fps}," + filters
+        return [
+            get_ffmpeg_exe(), "-loglevel", "error", "-nostdin", "-i", self.path,
+            "-vf", filters, "-f", "rawvideo", "-pix_fmt", "gray" if self.gray else "rgb24", "-",
+        ]
+
+    def __iter__(self):
+        process = subprocess.Popen(self.command(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            i = 0
+            while True:
+                buffer = self.buffers[i % len(self.buffers)]
+                if not read_into(process.stdout, buffer):
+                    return
+                yield buffer
+                i += 1
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
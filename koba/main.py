@@ -1,22 +1,21 @@
 # TODO: video support
 
+import os
 import sys
-import time
+import json
+import atexit
+import shutil
+import tempfile
 import logging
 
 import click
 import itertools
 import multiprocessing
 import concurrent.futures
-import collections
 from PIL import Image, ImageSequence, UnidentifiedImageError
-from moviepy import VideoFileClip
-from tqdm import tqdm
-from rich.console import Console
-from rich.text import Text
 
-from koba import __version__
-from koba.core import core
+from koba import __version__, player, timing
+from koba.core import cache, core, live, mosaic, pipeline, shm, store, video
 
 try:
     multiprocessing.set_start_method("spawn")
@@ -30,6 +29,129 @@ logging.basicConfig(
     level=logging.ERROR
 )
 
+def print_index_report(reports):
+    blocks = sum(report["blocks"] for report in reports)
+    recall = sum(report["recall"] * report["blocks"] for report in reports) / blocks
+    loss = sum(report["similarity_loss"] * report["blocks"] for report in reports) / blocks
+    exhaustive_time = sum(report["exhaustive_time"] for report in reports)
+    index_time = sum(report["index_time"] for report in reports)
+    click.echo(
+        f"ANN index: {recall:.1%} of {blocks} sampled blocks match the exhaustive search, "
+        f"mean similarity loss {loss:.5f}, {exhaustive_time / max(index_time, 1e-9):.1f}x faster.",
+        err=True
+    )
+
+def print_stats(accuracy_reports, block_cache=None):
+    if accuracy_reports:
+        print_index_report(accuracy_reports)
+    if block_cache is not None:
+        click.echo(block_cache.stats(), err=True)
+
+def load_frames(file, char_aspect, scale, cell, color, max_fps=None, buffers=2):
+    """
+    Opens an image, GIF or video. Returns a lazy iterator over its frames,
+    the frame count, the media type and the frame rate of videos. Videos are
+    decoded by ffmpeg at the working resolution, as gray frames unless color
+    is needed, and at most at max_fps.
+    """
+    try:
+        img = Image.open(file)
+        frame_count = getattr(img, 'n_frames', 1)
+        if frame_count == 1:
+            media_type = "image"
+        else:
+            media_type = "gif"
+        # every frame is copied as it is decoded, never the whole sequence at once
+        frames = (frame.copy() for frame in ImageSequence.Iterator(img))
+        return timing.timed(frames, "decode"), frame_count, media_type, None
+    except (UnidentifiedImageError, OSError):
+        try:
+            (width, height), source_fps, duration = video.probe(file)
+            fps = min(source_fps, max_fps) if max_fps else source_fps
+            size = core.working_size(width, height, char_aspect, scale, cell)
+            reader = video.VideoReader(file, size, fps if fps < source_fps else None, gray=not color, buffers=buffers)
+            frame_count = int(fps * duration)
+            if frame_count > 1:
+                media_type = "video"
+            else:
+                media_type = "image"
+            return timing.timed(reader, "decode"), frame_count, media_type, fps
+        except Exception as e:
+            logging.critical(f"Unsupported or unreadable image/video format for file: {file}. Error: {e}")
+            sys.exit(1)
+
+def prewarm(block_cache, block_shapes, characters, engine, index, probes):
+    """Fills the signature cache for --prewarm before anything is played."""
+    if block_cache.grid is None:
+        logging.warning("--prewarm needs a --quality below exact, skipping it.")
+    elif not core.prewarm_cache(block_cache, block_shapes, characters, engine.lower(), index=index, probes=probes):
+        logging.warning(f"There are too many signatures at {block_cache.quality} quality to prewarm them, skipping it.")
+
+def write_profile(summary, json_path, trace_path):
+    """Reports the stages recorded with --profile."""
+    document = timing.profile()
+    if summary:
+        click.echo(timing.profile_summary(document), err=True)
+    for path, content in ((json_path, document), (trace_path, timing.chrome_trace())):
+        if path:
+            with open(path, "w") as f:
+                json.dump(content, f)
+
+def frame_delay(frame, media_type, fps):
+    delay = 0
+    if media_type == "gif":
+        delay = frame.info.get("duration", 100) / 1000
+    elif media_type == "video":
+        delay = 1 / fps
+    elif media_type == "image":
+        delay = 0.1
+    
+    if not delay or delay == 0:
+        delay = 0.1
+    return delay
+
+def play_raw(
+    file, raw_size, raw_format, char_aspect, scale, engine, color, invert, stretch_contrast,
+    start_char, end_char, font, single_threaded, cache_mb, cache_stats, index, ann_probes, cell, glyph_cache, color_depth,
+    temporal_threshold, quality, prewarm_cache, analytic, dither
+):
+    """Renders a live stream of raw frames with in-process matching, which keeps the latency low."""
+    from koba.core import charsets, unify
+    characters = charsets.get_range(start_char, end_char)
+    core.init_worker(characters, font, glyph_cache)
+    unify.set_kernel_threads(1 if single_threaded else (os.cpu_count() or 1))
+    block_cache = cache.BlockCache(cache_mb * 2 ** 20, quality)
+    if prewarm_cache:
+        prewarm(block_cache, core.get_block_shapes(*raw_size, char_aspect, scale, cell), characters, engine, index, ann_probes)
+    reference = core.Reference(temporal_threshold) if temporal_threshold > 0 else None
+
+    def render(frame):
+        return core.process_frame(
+            frame, char_aspect, scale, engine, color, invert, stretch_contrast, False, start_char, end_char, False, font,
+            single_threaded=single_threaded,
+            block_cache=block_cache,
+            characters=characters,
+            index=index,
+            probes=ann_probes,
+            cell=cell,
+            use_atlas=glyph_cache,
+            color_depth=color_depth.lower(),
+            reference=reference,
+            analytic=analytic,
+            dither=dither
+        )
+
+    stream = sys.stdin.buffer if file == "-" else open(file, "rb")
+    try:
+        player.play_live(live.LatestFrame(stream, raw_size, raw_format), render)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+        if cache_stats:
+            click.echo(block_cache.stats(), err=True)
+
 @click.command("koba")
 @click.version_option(__version__)
 @click.argument(
@@ -38,8 +160,20 @@ logging.basicConfig(
         exists=True,
         file_okay=True,
         readable=True,
+        allow_dash=True,
     )
 )
+@click.option(
+    "--raw-size", default=None,
+    help="Read raw frames of WIDTHxHEIGHT pixels from FILE, a pipe or '-' for stdin, and show each as soon as it arrives."
+)
+@click.option(
+    "--raw-format",
+    type=click.Choice(list(live.RAW_FORMATS), case_sensitive=False),
+    default="gray",
+    show_default=True,
+    help="Pixel format of the raw frames read with --raw-size."
+)
 @click.option(
     "--char-aspect", default=2.0, show_default=True,
     help="Character height-to-width ratio (for aspect-correct output)."
@@ -62,6 +196,22 @@ logging.basicConfig(
     "--engine", "-e", default="diff", show_default=True,
     help="Similarity metric to use: brightness, ssim, diff, mse, ncc, hist, or cosine."
 )
+@click.option(
+    "--index",
+    type=click.Choice(["exhaustive", "bnb", "ann"], case_sensitive=False),
+    default="exhaustive",
+    show_default=True,
+    help="Glyph search strategy. bnb is an exact branch-and-bound search for the diff and mse engines, ann an approximate index for large character ranges."
+)
+@click.option(
+    "--ann-probes", default=4, show_default=True, type=click.IntRange(min=1),
+    help="Index clusters searched per block with --index ann. Higher values are slower but more accurate."
+)
+@click.option(
+    "--index-report",
+    is_flag=True,
+    help="Print how closely --index ann matches the exhaustive search on the first frame."
+)
 @click.option(
     "--font", default=None,
     help="Path to a custom TTF font file (overrides the default font)."
@@ -70,6 +220,18 @@ logging.basicConfig(
     "--char-range", default="32-126", show_default=True,
     help="Unicode range of characters to use, as start-end (e.g., 32-126)."
 )
+@click.option(
+    "--cell", default=None,
+    help="Fixed working resolution per character as WIDTHxHEIGHT pixels (e.g., 8x16). The frame is resized once so all blocks share this shape."
+)
+@click.option(
+    "--glyph-cache/--no-glyph-cache", default=True, show_default=True,
+    help="Keep rendered glyphs in a memory-mapped atlas in the user cache directory, shared by all runs and worker processes."
+)
+@click.option(
+    "--max-fps", default=None, type=click.FloatRange(min=0, min_open=True),
+    help="Highest frame rate videos are decoded at. Frames above it are dropped by the decoder."
+)
 @click.option(
     "--stretch-contrast",
     is_flag=True,
@@ -90,25 +252,124 @@ logging.basicConfig(
     is_flag=True,
     help="Runs the whole program single-threaded."
 )
+@click.option(
+    "--threads",
+    is_flag=True,
+    help="Matches blocks with multi-threaded native kernels instead of worker processes."
+)
+@click.option(
+    "--pipeline-depth", default=pipeline.PIPELINE_DEPTH, show_default=True, type=click.IntRange(min=1),
+    help="Frames of an animation matched by the worker processes at the same time."
+)
+@click.option(
+    "--temporal-threshold", default=0.0, show_default=True, type=click.FloatRange(min=0),
+    help="Cells of animations whose pixels changed by less than this mean absolute gray level since they were last matched keep their character. 0 matches every cell."
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Start playing animations once the look-ahead buffer is full and keep rendering in the background."
+)
+@click.option(
+    "--buffer", default=16, show_default=True, type=click.IntRange(min=1),
+    help="Frames rendered ahead of playback with --stream."
+)
+@click.option(
+    "--spill/--no-spill", default=True, show_default=True,
+    help="Keep the frames of a stream in a temporary store on disk for replays. Without it, replays render the file again."
+)
+@click.option(
+    "--cache-mb", default=64, show_default=True, type=click.IntRange(min=1),
+    help="Memory budget of the block result cache in megabytes."
+)
+@click.option(
+    "--quality", default="exact", show_default=True, type=click.Choice(list(cache.QUALITIES), case_sensitive=False),
+    help="Below exact, blocks that look alike share one cached glyph: a block is keyed by a thumbnail of 4x8 cells with 16 gray levels at high, 3x6 with 8 at medium or 2x4 with 4 at low."
+)
+@click.option(
+    "--prewarm", "prewarm_cache",
+    is_flag=True,
+    help="Match every signature of the block shapes before playing an animation. Only possible at low quality."
+)
+@click.option(
+    "--cache-stats",
+    is_flag=True,
+    help="Print block cache hits, misses and evictions at the end of the run."
+)
+@click.option(
+    "--cache-dir", default=None, type=click.Path(file_okay=False),
+    help="Directory for finished renderings. Rendering the same file with the same options again plays it straight from there."
+)
+@click.option(
+    "--timing", "show_timing",
+    is_flag=True,
+    help="Print how long imports, font lookup, glyph stacks and the first frame took at exit."
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Print the wall time and calls of every rendering stage, cache hit rate, unique blocks and worker utilization at exit."
+)
+@click.option(
+    "--profile-json",
+    default=None, type=click.Path(dir_okay=False),
+    help="Write the stage times in aggregate and per frame to this JSON file."
+)
+@click.option(
+    "--profile-trace",
+    default=None, type=click.Path(dir_okay=False),
+    help="Write the stages as Chrome trace events to this file, for chrome://tracing or Perfetto."
+)
 @click.option(
     "--color",
     is_flag=True,
     help="Renders the image in color."
 )
+@click.option(
+    "--color-depth",
+    type=click.Choice(["truecolor", "256", "16"], case_sensitive=False),
+    default="truecolor",
+    show_default=True,
+    help="Colors the terminal can show. Colors are mapped to the nearest entry of the 256 or 16 color palette."
+)
+@click.option(
+    "--analytic",
+    default=None, type=click.Choice(list(mosaic.RANGES), case_sensitive=False),
+    help="Compute Braille (10240-10495) or block element (9600-9631) characters directly from the pixels of every block instead of matching glyphs. Sets the character range."
+)
+@click.option(
+    "--dither",
+    default="none", show_default=True, type=click.Choice(list(mosaic.DITHERS), case_sensitive=False),
+    help="Ordered dithering of the --analytic renderers with a Bayer matrix of this size."
+)
 @click.option(
     "--fast-color",
     is_flag=True,
     help="Enables color and uses â–ˆ (U+2588) to improve processing speed. Only recommended for animated pictures."
 )
-def main(file, char_aspect, logging_level, save_blocks, save_chars, engine, font, char_range, stretch_contrast, scale, invert, single_threaded, color, fast_color):
-    console = Console()
+def main(file, raw_size, raw_format, char_aspect, logging_level, save_blocks, save_chars, engine, index, ann_probes, index_report, font, char_range, cell, glyph_cache, max_fps, stretch_contrast, scale, invert, single_threaded, threads, pipeline_depth, temporal_threshold, stream, buffer, spill, cache_mb, quality, prewarm_cache, cache_stats, cache_dir, show_timing, profile, profile_json, profile_trace, color, color_depth, analytic, dither, fast_color):
+    timing.mark("imports")
+    if show_timing:
+        atexit.register(lambda: click.echo(timing.report(), err=True))
+    if profile or profile_json or profile_trace:
+        timing.profiling = True
+        atexit.register(write_profile, profile, profile_json, profile_trace)
     # update logging level
     logging.getLogger().setLevel(getattr(logging, logging_level.upper(), logging.ERROR))
     
     if fast_color:
         color = True
         char_range = "9608-9608"
+    if analytic:
+        analytic = analytic.lower()
+        char_range = "-".join(str(code) for code in mosaic.RANGES[analytic])
+    elif dither != "none":
+        logging.warning("--dither only applies to --analytic renderers.")
     
+    index = index.lower()
+    if index == "bnb" and engine.lower() not in ("diff", "mse"):
+        logging.warning(f"The bnb index does not support the {engine} engine, searching exhaustively.")
+
     if font and not font.endswith(".ttf"):
         logging.critical("Please provide a font in TTF format.")
         sys.exit(1)
@@ -118,140 +379,201 @@ def main(file, char_aspect, logging_level, save_blocks, save_chars, engine, font
         if len(split_range) != 2:
             raise ValueError()
         start_char, end_char = int(split_range[0]), int(split_range[1])
-        if start_char >= end_char:
-            raise click.BadParameter("The start of the character range must be less than the end.")
+        # a single character, as --fast-color uses, is a valid range
+        if start_char > end_char:
+            raise click.BadParameter("The start of the character range must not be greater than the end.")
     except (ValueError, IndexError):
         raise click.BadParameter("The character range must be in the format 'start-end' (e.g., '32-126') with integers.")
     
-    media_type = None
-    
-    # loading file and reading basic info
-    try:
-        img = Image.open(file)
-        frame_count = getattr(img, 'n_frames', 1)
-        if frame_count == 1:
-            media_type = "image"
-        else:
-            media_type = "gif"
-        frames = [frame.copy() for frame in ImageSequence.Iterator(img)]
-    except (UnidentifiedImageError, OSError):
+    if cell:
         try:
-            clip = VideoFileClip(file)
-            frame_count = int(clip.fps * clip.duration)
-            frames = (Image.fromarray(f) for f in clip.iter_frames())
-            if frame_count > 1:
-                media_type = "video"
-            else:
-                media_type = "image"
-        except Exception as e:
-            logging.critical(f"Unsupported or unreadable image/video format for file: {file}. Error: {e}")
-            sys.exit(1)
-    else:
-        if not frames:
-            logging.critical(f"No frames found in image file: {file}.")
-            sys.exit(1)
-    
+            cell = tuple(int(part) for part in cell.lower().split("x"))
+            if len(cell) != 2 or min(cell) <= 0:
+                raise ValueError()
+        except ValueError:
+            raise click.BadParameter("The cell size must be in the format 'WIDTHxHEIGHT' (e.g., '8x16') with positive integers.")
+
+    if raw_size:
+        try:
+            raw_size = tuple(int(part) for part in raw_size.lower().split("x"))
+            if len(raw_size) != 2 or min(raw_size) <= 0:
+                raise ValueError()
+        except ValueError:
+            raise click.BadParameter("The raw frame size must be in the format 'WIDTHxHEIGHT' (e.g., '640x360') with positive integers.")
+        play_raw(
+            file, raw_size, raw_format.lower(), char_aspect, scale, engine, color, invert, stretch_contrast,
+            start_char, end_char, font, single_threaded, cache_mb, cache_stats, index, ann_probes, cell, glyph_cache, color_depth,
+            temporal_threshold, quality, prewarm_cache, analytic, dither
+        )
+        return
+    if file == "-":
+        raise click.BadParameter("Reading frames from stdin requires --raw-size.")
+
+    store_writer = None
+    if cache_dir:
+        # everything that changes the rendered output is part of the key, at
+        # a quality below exact the characters depend on the block cache too
+        approximate = quality.lower() != "exact"
+        store_path = os.path.join(cache_dir, store.render_key(file, {
+            "char_aspect": char_aspect, "engine": engine.lower(), "index": index, "ann_probes": ann_probes,
+            "font": font, "char_range": [start_char, end_char], "cell": cell, "stretch_contrast": stretch_contrast,
+            "scale": scale, "max_fps": max_fps, "temporal_threshold": temporal_threshold, "quality": quality.lower(),
+            "prewarm": prewarm_cache and approximate, "cache_mb": cache_mb if approximate else None, "analytic": analytic,
+            "dither": dither, "invert": invert, "color": color, "color_depth": color_depth.lower(), "columns": os.get_terminal_size().columns,
+        }))
+        cached = store.FrameStore.load(store_path)
+        if cached is not None:
+            logging.info(f"Playing {len(cached)} frame(s) from the render cache.")
+            replay = lambda: zip(cached, cached.delays)
+            player.play(replay(), replay, cached.media_type, len(cached) > 1, color)
+            return
+
+    # the pipeline holds up to pipeline_depth + 2 decoded frames, one more is being read
+    open_frames = lambda: load_frames(file, char_aspect, scale, cell, color, max_fps, buffers=pipeline_depth + 3)
+    frames, frame_count, media_type, fps = open_frames()
     logging.info(f"Image has {frame_count} frame(s).")
     is_animated = frame_count > 1
+    stream = stream and is_animated
+
+    spill_dir = None
+    if cache_dir:
+        store_writer = store.FrameStoreWriter(store_path, media_type)
+    elif stream and spill:
+        # replays of a stream are read back from a temporary store
+        spill_dir = tempfile.mkdtemp(prefix="koba-")
+        store_writer = store.FrameStoreWriter(os.path.join(spill_dir, "frames"), media_type)
 
     executor = None
-    block_cache = collections.OrderedDict()
+    frame_ring = None
+    prefetch = None
+    accuracy_reports = [] if index_report and index == "ann" else None
+    block_cache = cache.BlockCache(cache_mb * 2 ** 20, quality)
     characters = None
 
     try:
-        if is_animated:
+        if is_animated and not analytic:
             from koba.core import unify, charsets
             logging.info("Pre-rendering characters...")
-            if isinstance(frames, list):
-                first_frame = frames[0]
-            else:
-                first_frame = next(frames)
-                frames = itertools.chain([first_frame], frames)
-            width, height = first_frame.size
-            block_widths, block_heights, _ = core.calculate_block_sizes(width, height, char_aspect, scale)
-            unique_shapes = {(w, h) for w in set(block_widths) for h in set(block_heights)}
+            first_frame = next(frames)
+            frames = itertools.chain([first_frame], frames)
+            width, height = core.frame_size(first_frame)
+            unique_shapes = core.get_block_shapes(width, height, char_aspect, scale, cell)
             
             characters = charsets.get_range(start_char, end_char)
-            
-            if font:
-                unify.font_path = font
-            
-            if abs(start_char - end_char) >= 400:
-                for char in tqdm(characters, total=len(characters), desc="Loading fonts"):
-                    unify.get_font(char)
-
-            with tqdm(total=len(unique_shapes) * len(characters), desc="Pre-rendering characters", disable=logging_level != "DEBUG") as pbar:
-                unify.pre_render_characters(characters, unique_shapes, save_chars, pbar.update)
-
-            if not single_threaded:
-                from koba.core.core import init_worker
-                executor = concurrent.futures.ProcessPoolExecutor(initializer=init_worker, initargs=(characters,))
-
-        frame_delays = []
-        all_frames = []
-        
-        # Pass characters for single-threaded animated case
-        chars_for_process = characters if (is_animated and single_threaded) else None
-
-        for i, frame in tqdm(enumerate(frames), total=frame_count, desc="Processing frames", disable=not is_animated):
-            all_frames.append(core.process(
-                frame, char_aspect, scale, engine, color, invert, stretch_contrast,
-                save_blocks, start_char, end_char, save_chars, font, 
-                single_threaded=single_threaded, 
-                show_progress=not is_animated,
-                executor=executor,
-                block_cache=block_cache,
-                characters=chars_for_process
-            ))
-            delay = 0
-            if media_type == "gif":
-                delay = frame.info.get("duration", 100) / 1000
-            elif media_type == "video":
-                delay = 1 / clip.fps
-            elif media_type == "image":
-                delay = 0.1
-            
-            if not delay or delay == 0:
-                delay = 0.1
-            frame_delays.append(delay)
+            core.init_worker(characters, font, glyph_cache)
+
+            # building the glyph atlases once, worker processes only map them
+            from tqdm import tqdm
+            with timing.span("glyph stacks"), tqdm(total=len(unique_shapes) * len(characters), desc="Pre-rendering characters", disable=logging_level != "DEBUG") as pbar:
+                for block_width, block_height in unique_shapes:
+                    unify.get_glyph_stack(block_width, block_height, save_chars, pbar.update)
+            if prewarm_cache:
+                with timing.span("prewarm"):
+                    prewarm(block_cache, unique_shapes, characters, engine, index, ann_probes)
+
+            if not single_threaded and not threads:
+                executor = concurrent.futures.ProcessPoolExecutor(initializer=core.init_worker, initargs=(characters, font, glyph_cache))
+                timing.workers = executor._max_workers
+                # frames reach the workers through shared memory instead of pickled blocks
+                frame_ring = shm.FrameRing(width * height, n_slots=pipeline_depth)
+
+        if not executor:
+            from koba.core import unify
+            unify.set_kernel_threads(1 if single_threaded else (os.cpu_count() or 1))
+
+        options = (char_aspect, scale, engine, color, invert, stretch_contrast, save_blocks, start_char, end_char, save_chars, font)
+
+        def render(frames, writer=None):
+            """Yields (rendered frame, delay) tuples, appending them to writer."""
+            if is_animated:
+                rendered_frames = pipeline.render_frames(
+                    frames, *options,
+                    executor=executor,
+                    frame_ring=frame_ring,
+                    block_cache=block_cache,
+                    characters=characters,
+                    index=index,
+                    probes=ann_probes,
+                    index_report=accuracy_reports,
+                    cell=cell,
+                    use_atlas=glyph_cache,
+                    depth=pipeline_depth,
+                    color_depth=color_depth.lower(),
+                    temporal_threshold=temporal_threshold,
+                    analytic=analytic,
+                    dither=dither
+                )
+            else:
+                rendered_frames = (
+                    (frame, core.process_frame(
+                        frame, *options,
+                        single_threaded=single_threaded,
+                        show_progress=True,
+                        block_cache=block_cache,
+                        index=index,
+                        probes=ann_probes,
+                        index_report=accuracy_reports,
+                        cell=cell,
+                        use_atlas=glyph_cache,
+                        color_depth=color_depth.lower(),
+                        analytic=analytic,
+                        dither=dither
+                    ))
+                    for frame in frames
+                )
+            for i, (frame, rendered) in enumerate(rendered_frames):
+                if i == 0:
+                    timing.mark("first frame")
+                delay = frame_delay(frame, media_type, fps)
+                if writer:
+                    writer.append(rendered, delay)
+                yield rendered, delay
+
+        if stream:
+            # playback starts once the look-ahead buffer is full, rendering goes on behind it
+            prefetch = pipeline.Prefetch(render(frames, store_writer), buffer, "koba-render")
+            prefetch.wait_filled()
+            rendered_store = []
+
+            def replay():
+                nonlocal prefetch
+                if not rendered_store:
+                    prefetch.close()
+                    if store_writer:
+                        rendered_store.append(store_writer.finish())
+                if rendered_store:
+                    return zip(rendered_store[0], rendered_store[0].delays)
+                # without a spill store every replay renders the file again
+                prefetch = pipeline.Prefetch(render(open_frames()[0]), buffer, "koba-render")
+                return prefetch
+
+            player.play(prefetch, replay, media_type, is_animated, color)
+        else:
+            from tqdm import tqdm
+            rendered_frames = list(tqdm(render(frames, store_writer), total=frame_count, desc="Processing frames", disable=not is_animated))
+            logging.debug(f"Frame delays: {[delay for _, delay in rendered_frames[:3]]} ...")
+            print_stats(accuracy_reports, block_cache if cache_stats else None)
+
+            replay = lambda: rendered_frames
+            if store_writer:
+                # frames are read back from the memory-mapped store
+                finished = store_writer.finish()
+                rendered_frames = None
+                replay = lambda: zip(finished, finished.delays)
+            player.play(replay(), replay, media_type, is_animated, color)
 
+    except BaseException:
+        if prefetch:
+            prefetch.close()
+        if store_writer:
+            store_writer.discard()
+        raise
     finally:
         if executor:
             executor.shutdown()
-
-    logging.debug(f"Frame delays: {frame_delays[:3]} ...")
-
-    if media_type == "video":
-        input("Press [Enter] to start playback: ")
-
-    prev_lines = 0
-    if is_animated:
-        while True:
-            for frame, delay in zip(all_frames, frame_delays):
-                start = time.time()
-                lines = frame.count('\n')
-                if prev_lines > 0:
-                    sys.stdout.write(f"\r\033[{prev_lines}A")
-                    sys.stdout.write("\033[J")
-                print(frame, end="")
-                sys.stdout.flush()
-                prev_lines = lines
-                elapsed = time.time() - start
-                sleep_time = max(0, delay - elapsed)
-                time.sleep(sleep_time)
-                
-            if media_type == "video":
-                try:
-                    input("\nPress [Enter] to replay, or Ctrl+C to quit: ")
-                    sys.stdout.write(f"\r\033[{prev_lines}A")
-                    sys.stdout.write("\033[J")
-                    sys.stdout.flush()
-                except KeyboardInterrupt:
-                    print("\nExiting.")
-                    break
-    else:
-        frame = all_frames[0]
-        if color:
-            console.print(Text.from_ansi(frame))
-        else:
-            print(frame)
\ No newline at end of file
+        if frame_ring:
+            frame_ring.close()
+        if spill_dir:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+        if stream:
+            print_stats(accuracy_reports, block_cache if cache_stats else None)
@@ -0,0 +1,227 @@
+import sys
+import time
+import functools
+import unicodedata
+
+import numpy as np
+
+from koba import timing
+
+# share of changed cells above which a frame is drawn in full
+FULL_REDRAW_RATIO = 0.5
+# unchanged cells between two changed runs that are rewritten instead of skipped
+MERGE_GAP = 4
+
+class PlaybackStats:
+    """Frames shown and dropped against the presentation time they covered."""
+
+    def __init__(self):
+        self.shown = 0
+        self.dropped = 0
+        self.media_time = 0.0
+        self.wall_time = 0.0
+        self.bytes_written = 0
+
+    def __str__(self):
+        frames = self.shown + self.dropped
+        target = frames / self.media_time if self.media_time else 0.0
+        achieved = self.shown / self.wall_time if self.wall_time else 0.0
+        rate = self.bytes_written / self.wall_time / 1024 if self.wall_time else 0.0
+        return (
+            f"Playback: target {target:.1f} fps, achieved {achieved:.1f} fps, "
+            f"{self.dropped} of {frames} frames dropped, {rate:.0f} kB/s written."
+        )
+
+def changed_runs(changed, gap=MERGE_GAP):
+    """(start, end) of the runs of changed cells in a row, joining runs at most gap cells apart."""
+    cells = np.flatnonzero(changed)
+    if not len(cells):
+        return []
+    breaks = np.flatnonzero(np.diff(cells) > gap + 1)
+    starts = cells[np.concatenate(([0], breaks + 1))]
+    ends = cells[np.concatenate((breaks, [len(cells) - 1]))] + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+# code points below this are one terminal column wide
+NARROW_END = 0x300
+
+@functools.lru_cache(maxsize=None)
+def char_width(code):
+    """Terminal columns of a character: 2 for wide East Asian ones, 0 for combining marks."""
+    char = chr(code)
+    if unicodedata.combining(char):
+        return 0
+    return 2 if unicodedata.east_asian_width(char) in "WF" else 1
+
+def cell_widths(codes):
+    """Terminal columns of every cell of a grid of code points."""
+    if not codes.size or codes.max() < NARROW_END:
+        return np.ones(codes.shape, dtype=np.intp)
+    unique, inverse = np.unique(codes, return_inverse=True)
+    widths = np.array([char_width(code) for code in unique.tolist()], dtype=np.intp)
+    return widths[inverse].reshape(codes.shape)
+
+class TerminalWriter:
+    """
+    Draws frames in place. After the first frame only the runs of cells that
+    changed since the previous frame are written, reached with relative cursor
+    moves over the terminal columns of the cells before them. Rows whose cells
+    changed width are rewritten whole, frames that changed shape or changed
+    mostly are drawn in full.
+    The cursor rests at the end of the last row between frames.
+    """
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self.previous = None
+        self.bytes_written = 0
+
+    def _emit(self, text):
+        self.out.write(text)
+        self.out.flush()
+        self.bytes_written += len(text.encode())
+
+    def write(self, frame):
+        with timing.stage("colorize"):
+            text = self.render(frame)
+        with timing.stage("terminal write"):
+            self._emit(text)
+
+    def render(self, frame):
+        """The escape sequences and text that turn the last frame into frame."""
+        previous = self.previous
+        self.previous = frame
+        if (
+            previous is not None and previous.shape == frame.shape
+            and (previous.colors is None) == (frame.colors is None) and previous.depth == frame.depth
+        ):
+            changed = frame.codes != previous.codes
+            if frame.colors is not None:
+                changed |= (frame.colors != previous.colors).reshape(*frame.shape, -1).any(axis=2)
+            if np.count_nonzero(changed) <= FULL_REDRAW_RATIO * changed.size:
+                return self.delta(frame, changed, previous)
+
+        text = str(frame)
+        if previous is not None:
+            rows_up = previous.shape[0] - 1
+            text = (f"\r\033[{rows_up}A" if rows_up else "\r") + "\033[J" + text
+        return text
+
+    def delta(self, frame, changed, previous):
+        rows = frame.shape[0]
+        widths = cell_widths(frame.codes)
+        # the cells after a cell that changed width moved on the screen
+        moved = (widths != cell_widths(previous.codes)).any(axis=1)
+        changed = changed | moved[:, None]
+        row = rows - 1
+        parts = []
+        for target in np.flatnonzero(changed.any(axis=1)).tolist():
+            if target != row:
+                parts.append(f"\033[{row - target}A" if target < row else f"\033[{target - row}B")
+                row = target
+            if moved[row]:
+                parts.append("\r" + frame.segment(row) + "\033[K")
+                continue
+            for start, end in changed_runs(changed[row]):
+                column = int(widths[row, :start].sum())
+                parts.append(f"\r\033[{column}C" if column else "\r")
+                parts.append(frame.segment(row, start, end))
+        if not parts:
+            return ""
+        # back to the end of the last row
+        if row != rows - 1:
+            parts.append(f"\033[{rows - 1 - row}B")
+        parts.append(f"\r\033[{int(widths[-1].sum())}C")
+        return "".join(parts)
+
+    def clear(self, lines_below=0):
+        """Removes the last frame, with the cursor lines_below lines under its last row."""
+        if self.previous is not None:
+            rows_up = self.previous.shape[0] - 1 + lines_below
+            self._emit((f"\r\033[{rows_up}A" if rows_up else "\r") + "\033[J")
+        self.previous = None
+
+def play_pass(frames, stats, write):
+    """
+    Plays (frame, delay) pairs once. Every frame is due at an absolute time
+    on a monotonic clock, the sum of the delays before it, so drawing time
+    never accumulates as drift. A frame that is already over when it is
+    ready is skipped if a newer frame is waiting, which frames with a ready()
+    method tell, other iterables hold rendered frames. Otherwise rendering
+    is the bottleneck: the late frame is shown and the clock resynced to it.
+    """
+    ready = getattr(frames, "ready", lambda: True)
+    start = time.monotonic()
+    due = 0.0
+    media_time = 0.0
+    try:
+        for frame, delay in frames:
+            media_time += delay
+            now = time.monotonic() - start
+            if now >= due + delay and ready():
+                stats.dropped += 1
+            else:
+                if due > now:
+                    time.sleep(due - now)
+                elif now >= due + delay:
+                    due = now
+                write(frame)
+                stats.shown += 1
+            due += delay
+        # the last frame stays up for its delay
+        now = time.monotonic() - start
+        if due > now:
+            time.sleep(due - now)
+    finally:
+        stats.media_time += media_time
+        stats.wall_time += time.monotonic() - start
+
+def play(frames, replay, media_type, is_animated, color):
+    """Plays (frame, delay) pairs, replay returns them again for every further loop."""
+    if not is_animated:
+        frame, _ = next(iter(frames))
+        if color:
+            from rich.console import Console
+            from rich.text import Text
+            Console().print(Text.from_ansi(str(frame)))
+        else:
+            print(frame)
+        return
+
+    if media_type == "video":
+        input("Press [Enter] to start playback: ")
+
+    writer = TerminalWriter()
+    stats = PlaybackStats()
+    try:
+        while True:
+            play_pass(frames, stats, writer.write)
+            if media_type == "video":
+                try:
+                    input("\nPress [Enter] to replay, or Ctrl+C to quit: ")
+                    writer.clear(lines_below=2)
+                except KeyboardInterrupt:
+                    print("\nExiting.")
+                    break
+            frames = replay()
+    finally:
+        stats.bytes_written = writer.bytes_written
+        print(f"\n{stats}", file=sys.stderr)
+
+def play_live(frames, render):
+    """
+    Renders and draws frames of a live source as soon as they arrive, see
+    live.LatestFrame. The stats compare against the rate frames arrived at.
+    """
+    writer = TerminalWriter()
+    stats = PlaybackStats()
+    start = time.monotonic()
+    try:
+        for frame in frames:
+            writer.write(render(frame))
+            stats.shown += 1
+    finally:
+        stats.dropped = frames.dropped
+        stats.wall_time = stats.media_time = time.monotonic() - start
+        stats.bytes_written = writer.bytes_written
+        print(f"\n{stats}", file=sys.stderr)
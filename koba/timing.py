@@ -0,0 +1,162 @@
+import os
+import time
+import itertools
+import threading
+import collections
+from contextlib import contextmanager
+
+# set when koba is imported, everything is timed from here
+START = time.perf_counter()
+
+# (name, offset from START, duration) in seconds
+spans = []
+
+# stages are only recorded while profiling, see --profile
+profiling = False
+# (stage, process id, thread id, offset from START, duration, frame or None)
+events = []
+counters = collections.Counter()
+# worker processes matching blocks, for their utilization
+workers = 0
+_local = threading.local()
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans.append((name, start - START, time.perf_counter() - start))
+
+def mark(name):
+    """Records a span from the end of the last one, or from START, until now."""
+    start = max([offset + duration for _, offset, duration in spans], default=0.0)
+    spans.append((name, start, time.perf_counter() - START - start))
+
+def report():
+    lines = ["Timing since koba was imported:"]
+    for name, offset, duration in spans:
+        lines.append(f"  {name:<24} {duration * 1000:9.1f} ms   at {offset * 1000:9.1f} ms")
+    lines.append(f"  {'total':<24} {(time.perf_counter() - START) * 1000:9.1f} ms")
+    return "\n".join(lines)
+
+def set_frame(index):
+    """Attributes the stages this thread records from now on to a frame."""
+    _local.frame = index
+
+def record(name, start, end, frame=None, pid=None):
+    """Records a stage between two perf_counter values, which all processes share."""
+    if frame is None:
+        frame = getattr(_local, "frame", None)
+    if pid is None:
+        pid, tid = os.getpid(), threading.get_ident()
+    else:
+        tid = pid
+    events.append((name, pid, tid, start - START, end - start, frame))
+
+@contextmanager
+def stage(name):
+    if not profiling:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, start, time.perf_counter())
+
+def count(name, n=1):
+    if profiling:
+        counters[name] += n
+
+def timed(frames, name):
+    """
+    An iterator over frames that records every step as a stage of that
+    frame. Without --profile it is just the plain iterator.
+    """
+    if not profiling:
+        return iter(frames)
+
+    def steps():
+        iterator = iter(frames)
+        for index in itertools.count():
+            start = time.perf_counter()
+            try:
+                frame = next(iterator)
+            except StopIteration:
+                return
+            record(name, start, time.perf_counter(), frame=index)
+            yield frame
+    return steps()
+
+def _ratio(part, whole):
+    return part / whole if whole else None
+
+def profile():
+    """The recorded stages in aggregate and per frame, with the derived rates."""
+    stages = {}
+    frames = collections.defaultdict(dict)
+    for name, _, _, _, duration, frame in events:
+        calls, seconds = stages.get(name, (0, 0.0))
+        stages[name] = (calls + 1, seconds + duration)
+        if frame is not None:
+            frames[frame][name] = frames[frame].get(name, 0.0) + duration * 1000
+
+    utilization = None
+    worker_events = [event for event in events if event[0] == "worker match"]
+    if worker_events and workers:
+        begin = min(event[3] for event in worker_events)
+        end = max(event[3] + event[4] for event in worker_events)
+        busy = sum(event[4] for event in worker_events)
+        utilization = _ratio(busy, workers * (end - begin))
+
+    return {
+        "wall_ms": (time.perf_counter() - START) * 1000,
+        "stages": {
+            name: {"calls": calls, "total_ms": seconds * 1000, "mean_ms": seconds * 1000 / calls}
+            for name, (calls, seconds) in stages.items()
+        },
+        "frames": [{"frame": frame, "stages": frames[frame]} for frame in sorted(frames)],
+        "counters": dict(counters),
+        "cache_hit_rate": _ratio(counters["cache hits"], counters["cache hits"] + counters["cache misses"]),
+        "unique_ratio": _ratio(counters["unique blocks"], counters["cells"]),
+        "workers": workers,
+        "worker_utilization": utilization,
+    }
+
+def profile_summary(document=None):
+    document = document or profile()
+    wall = document["wall_ms"]
+    lines = [
+        f"Profile of {wall:.1f} ms, stages of different threads and workers overlap:",
+        f"  {'stage':<20} {'calls':>7} {'total ms':>10} {'mean ms':>9} {'of wall':>8}",
+    ]
+    for name, stage_stats in sorted(document["stages"].items(), key=lambda item: -item[1]["total_ms"]):
+        lines.append(
+            f"  {name:<20} {stage_stats['calls']:>7} {stage_stats['total_ms']:>10.1f} "
+            f"{stage_stats['mean_ms']:>9.2f} {stage_stats['total_ms'] / wall:>8.1%}"
+        )
+    rates = []
+    if document["cache_hit_rate"] is not None:
+        rates.append(f"block cache hit rate {document['cache_hit_rate']:.1%}")
+    if document["unique_ratio"] is not None:
+        rates.append(f"unique blocks {document['unique_ratio']:.1%} of cells")
+    if document["worker_utilization"] is not None:
+        rates.append(f"utilization of {document['workers']} workers {document['worker_utilization']:.1%}")
+    if rates:
+        lines.append("  " + ", ".join(rates).capitalize() + ".")
+    return "\n".join(lines)
+
+def chrome_trace():
+    """The recorded stages as Chrome trace events, for chrome://tracing or Perfetto."""
+    return {
+        "displayTimeUnit": "ms",
+        "traceEvents": [
+            {
+                "name": name, "cat": "koba", "ph": "X", "pid": pid, "tid": tid,
+                "ts": offset * 1e6, "dur": duration * 1e6,
+                "args": {} if frame is None else {"frame": frame},
+            }
+            for name, pid, tid, offset, duration, frame in events
+        ],
+    }
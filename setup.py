@@ -1,12 +1,25 @@
+import sys
+
 from setuptools import setup, Extension
 from Cython.Build import cythonize
 import numpy
 
+# the batch kernels use OpenMP where the compiler supports it out of the box,
+# without it prange simply runs on one thread
+if sys.platform == "win32":
+    openmp_compile_args, openmp_link_args = ["/openmp"], []
+elif sys.platform == "darwin":
+    openmp_compile_args, openmp_link_args = [], []
+else:
+    openmp_compile_args, openmp_link_args = ["-fopenmp"], ["-fopenmp"]
+
 extensions = [
     Extension(
         "koba.core._unify_optim",
         ["koba/core/_unify_optim.pyx"],
-        include_dirs=[numpy.get_include()]
+        include_dirs=[numpy.get_include()],
+        extra_compile_args=openmp_compile_args,
+        extra_link_args=openmp_link_args
     )
 ]
 
@@ -0,0 +1,6 @@
+import pytest
+
+# keep glyph atlases of test runs out of the user cache directory
+@pytest.fixture(autouse=True)
+def koba_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("KOBA_CACHE_DIR", str(tmp_path / "koba-cache"))
@@ -0,0 +1,34 @@
+import re
+
+import numpy as np
+from koba.core import ansi
+
+def parse(text):
+    """Cells of a colorized run as (char, SGR parameters) pairs."""
+    cells = []
+    current = None
+    for match in re.finditer(r"\033\[([\d;]*)m|(.)", text):
+        params, char = match.groups()
+        if char is None:
+            current = params
+        else:
+            cells.append((char, current))
+    return cells
+
+def test_colorize_coalesces_equal_neighbors():
+    colors = np.array([[1, 2, 3], [1, 2, 3], [4, 5, 6], [1, 2, 3]], dtype=np.uint8)
+    text = ansi.colorize("abcd", colors, 24)
+
+    assert text.count("\033[38;2;") == 3
+    assert text.endswith(ansi.RESET)
+    assert parse(text)[:4] == [("a", "38;2;1;2;3"), ("b", "38;2;1;2;3"), ("c", "38;2;4;5;6"), ("d", "38;2;1;2;3")]
+
+def test_quantize_maps_to_nearest_palette_entry():
+    # the lookup table is exact for the centers of its bins
+    rgb = np.array([[252, 4, 4], [4, 4, 4], [252, 252, 252], [132, 132, 132], [60, 180, 100]], dtype=np.uint8)
+    for depth in (8, 4):
+        indices = ansi.quantize(rgb, depth)
+        palette = ansi.palette(depth).astype(int)
+        distances = ((rgb[:, None].astype(int) - palette[None]) ** 2).sum(axis=2)
+        assert np.array_equal(distances[np.arange(len(rgb)), indices], distances.min(axis=1))
+    assert ansi.colorize("x", ansi.quantize(rgb[:1], 4), 4) == "\033[91mx" + ansi.RESET
@@ -0,0 +1,12 @@
+import numpy as np
+from koba.core import atlas, charsets, _unify_shared
+
+def test_atlas_is_saved_and_memory_mapped():
+    characters = charsets.get_range(65, 70)
+    glyphs, valid = atlas.load_atlas(characters, 8, 16)
+    mapped, mapped_valid = atlas.load_atlas(characters, 8, 16)
+
+    assert isinstance(mapped, np.memmap)
+    assert np.array_equal(glyphs, mapped)
+    assert np.array_equal(valid, mapped_valid)
+    assert np.array_equal(mapped[0], _unify_shared.get_char("A", 8, 16))
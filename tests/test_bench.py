@@ -0,0 +1,49 @@
+import sys
+import subprocess
+
+import numpy as np
+from koba import bench
+from koba.core import core
+
+def test_corpus_is_generated_at_the_requested_resolution():
+    for name in bench.CORPUS:
+        frames = bench.make_corpus(name, "sd")
+        assert all(frame.shape == (360, 640, 3) and frame.dtype == np.uint8 for frame in frames)
+    assert len(bench.make_corpus("video", "sd")) == bench.VIDEO_FRAMES
+    assert np.array_equal(bench.make_corpus("noise", "sd")[0], bench.make_corpus("noise", "sd")[0])
+
+def test_run_measures_every_case(monkeypatch):
+    monkeypatch.setattr(core, "columns", None)
+    document = bench.run(["gradient", "text"], ["brightness"], ["ascii"], ["sd"], ["single"], 1, 40)
+    assert [result["case"] for result in document["results"]] == [
+        "gradient/sd/brightness/ascii/single/exact", "text/sd/brightness/ascii/single/exact"
+    ]
+    for result in document["results"]:
+        assert result["grid"][1] == 40
+        assert result["seconds"] > 0 and result["matched_blocks"] > 0
+        assert result["divergence"] == 0
+
+def test_run_reports_divergence_of_approximate_qualities(monkeypatch):
+    monkeypatch.setattr(core, "columns", None)
+    document = bench.run(["gradient"], ["brightness"], ["ascii"], ["sd"], ["single"], 1, 40, qualities=("low",))
+    result, = document["results"]
+    assert result["quality"] == "low" and 0 < result["divergence"] < 1
+
+def test_peak_memory_does_not_depend_on_earlier_cases():
+    # the first case of a fresh process builds the glyph stacks, the second finds them
+    code = (
+        "from koba import bench; from koba.core import charsets, core; core.columns = 40; "
+        "core.init_worker(charsets.get_range(*bench.CHARSETS['ascii'])); "
+        "frames = bench.make_corpus('gradient', 'sd'); "
+        "print(*(bench.run_case(frames, 'diff', 'ascii', repeat=1)['peak_mb'] for _ in range(2)))"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    cold, warm = (float(value) for value in output.split())
+    assert abs(cold - warm) < 0.1 * warm
+
+def test_compare_flags_slower_cases_only():
+    def document(seconds, peak_mb):
+        return {"results": [{"case": "a", "seconds": seconds, "peak_mb": peak_mb}]}
+    assert bench.compare(document(1.0, 10.0), document(1.1, 10.0), 0.2) == []
+    assert bench.compare(document(1.0, 10.0), document(1.5, 13.0), 0.2) == [("a", "seconds", 1.0, 1.5), ("a", "peak_mb", 10.0, 13.0)]
+    assert bench.compare({"results": []}, document(9.0, 9.0), 0.2) == []
@@ -0,0 +1,40 @@
+import numpy as np
+from koba.core import cache
+
+def test_block_cache_evicts_least_recently_used():
+    block_cache = cache.BlockCache(cache.ENTRY_BYTES * cache.WAYS)
+    digests = np.arange(1, cache.WAYS + 2, dtype=np.uint64)
+
+    block_cache.insert(digests[:-1], digests[:-1])
+    block_cache.lookup(digests[:1])
+    block_cache.insert(digests[-1:], digests[-1:])
+
+    found, values = block_cache.lookup(digests)
+    assert block_cache.evictions == 1
+    assert found[0] and found[-1] and not found[1]
+    assert values[0] == 1
+
+def test_block_digests_depend_on_shape():
+    blocks = np.zeros((1, 4, 2), dtype=np.uint8)
+    assert cache.block_digests(blocks)[0] != cache.block_digests(blocks.reshape(1, 2, 4))[0]
+
+def test_block_signatures_join_blocks_that_look_alike():
+    grid = cache.QUALITIES["low"]
+    block = np.full((1, 12, 6), 100, dtype=np.uint8)
+    similar = block + np.random.default_rng(0).integers(0, 3, block.shape, dtype=np.uint8)
+    different = block.copy()
+    different[:, :6] = 250
+    signatures = cache.block_signatures(np.concatenate([block, similar, different]), grid)
+    assert signatures[0] == signatures[1] != signatures[2]
+    assert cache.block_signatures(block.reshape(1, 6, 12), grid)[0] != signatures[0]
+
+def test_prewarmed_cache_knows_every_signature():
+    from koba.core import charsets, core
+    characters = charsets.get_range(32, 126)
+    core.init_worker(characters)
+    block_cache = cache.BlockCache(2 ** 22, "low")
+    assert core.prewarm_cache(block_cache, {(5, 10)}, characters, "brightness")
+    blocks = np.random.default_rng(0).integers(0, 256, (200, 10, 5), dtype=np.uint8)
+    found, values = block_cache.lookup(block_cache.digests(blocks))
+    assert found.all() and set(values.tolist()) <= {ord(char) for char in characters}
+    assert not core.prewarm_cache(cache.BlockCache(2 ** 16, "high"), {(5, 10)}, characters, "brightness")
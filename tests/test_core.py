@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+from PIL import Image
+from koba.core import core
+
+def test_split_blocks_covers_image():
+    img = np.arange(23 * 17, dtype=np.uint8).reshape(23, 17)
+    block_widths = [4, 4, 3, 3, 3]
+    block_heights = [8, 8, 7]
+
+    regions = core.split_blocks(img, block_widths, block_heights)
+    assert len(regions) == 4
+
+    y_offsets = np.concatenate(([0], np.cumsum(block_heights)))
+    x_offsets = np.concatenate(([0], np.cumsum(block_widths)))
+    for row, col, view in regions:
+        for r in range(view.shape[0]):
+            for c in range(view.shape[1]):
+                y, x = y_offsets[row + r], x_offsets[col + c]
+                expected = img[y:y + block_heights[row + r], x:x + block_widths[col + c]]
+                assert np.array_equal(view[r, c], expected)
+
+def test_block_colors_are_truncated_means(monkeypatch):
+    monkeypatch.setattr(os, "get_terminal_size", lambda *args: os.terminal_size((7, 10)))
+    img = np.random.default_rng(0).integers(0, 256, (41, 30, 3), dtype=np.uint8)
+    frame = core.process_frame(Image.fromarray(img), 2.0, 1.0, "diff", True, False, False, False, 9608, 9608, False, None, True)
+
+    block_widths, block_heights, _ = core.calculate_block_sizes(30, 41, 2.0, 1.0)
+    y_offsets = np.cumsum([0] + block_heights)
+    x_offsets = np.cumsum([0] + block_widths)
+    for r in range(len(block_heights)):
+        for c in range(len(block_widths)):
+            block = img[y_offsets[r]:y_offsets[r + 1], x_offsets[c]:x_offsets[c + 1]]
+            assert np.array_equal(frame.colors[r, c], block.mean(axis=(0, 1)).astype(int))
+
+def test_working_size_keeps_aspect_and_grid(monkeypatch):
+    monkeypatch.setattr(os, "get_terminal_size", lambda *args: os.terminal_size((80, 24)))
+    assert core.working_size(320, 240, 2.0, 1.0) == (320, 240)
+    for width, height in ((1920, 1080), (1080, 1920), (3840, 1600)):
+        target_width, target_height = core.working_size(width, height, 2.0, 1.0)
+        assert target_width < width and abs(target_width / target_height - width / height) < 0.01
+        # the character grid is the one of the full resolution source
+        source_grid = core.calculate_block_sizes(width, height, 2.0, 1.0)
+        target_grid = core.calculate_block_sizes(target_width, target_height, 2.0, 1.0)
+        assert (target_grid[2], len(target_grid[1])) == (source_grid[2], len(source_grid[1]))
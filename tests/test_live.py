@@ -0,0 +1,17 @@
+import io
+
+import numpy as np
+from koba.core import live
+
+def test_latest_frame_drops_frames_a_slow_consumer_missed():
+    frames = np.arange(5, dtype=np.uint8)[:, None, None] * np.ones((1, 2, 3), dtype=np.uint8)
+    source = live.LatestFrame(io.BytesIO(frames.tobytes()), (3, 2))
+    source.thread.join()
+
+    received = [frame.copy() for frame in source]
+    assert len(received) == 1 and np.array_equal(received[0], frames[-1])
+    assert source.received == 5 and source.dropped == 4
+
+def test_latest_frame_ignores_a_partial_last_frame():
+    source = live.LatestFrame(io.BytesIO(bytes(6 * 3 + 2)), (3, 2), "rgb24")
+    assert [frame.shape for frame in source] == [(2, 3, 3)]
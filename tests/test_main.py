@@ -1,7 +1,11 @@
 from click.testing import CliRunner
 from koba.main import main
 from PIL import Image
+from imageio_ffmpeg import get_ffmpeg_exe
+from koba import player
 import os
+import sys
+import subprocess
 
 def test_cli_runs_successfully(monkeypatch):
     # mock get_terminal_size to avoid errors
@@ -37,4 +41,39 @@ def test_cli_bad_char_range():
     os.remove(test_image_path)
 
     assert result.exit_code == 2
-    assert "Invalid value" in result.output
\ No newline at end of file
+    assert "Invalid value" in result.output
+
+def test_cli_plays_video(monkeypatch, tmp_path):
+    monkeypatch.setattr(os, 'get_terminal_size', lambda *args: os.terminal_size((40, 20)))
+    path = str(tmp_path / "clip.mp4")
+    subprocess.run(
+        [get_ffmpeg_exe(), "-loglevel", "error", "-f", "lavfi", "-i", "testsrc=duration=1:size=64x48:rate=5", "-pix_fmt", "yuv420p", path],
+        check=True
+    )
+    played = []
+    monkeypatch.setattr(player, 'play', lambda frames, *args: played.extend(frames))
+
+    result = CliRunner().invoke(main, [path, '--single-threaded'])
+
+    assert result.exit_code == 0, result.output
+    assert len(played) == 5
+
+def test_cli_plays_gif_with_fast_color(monkeypatch, tmp_path):
+    monkeypatch.setattr(os, 'get_terminal_size', lambda *args: os.terminal_size((40, 20)))
+    path = str(tmp_path / "clip.gif")
+    frames = [Image.new('RGB', (64, 48), color) for color in ('red', 'green', 'blue')]
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=100)
+    played = []
+    monkeypatch.setattr(player, 'play', lambda frames, *args: played.extend(frames))
+
+    result = CliRunner().invoke(main, [path, '--fast-color', '--single-threaded'])
+
+    assert result.exit_code == 0, result.output
+    assert len(played) == 3
+    # every cell is a full block, only the colors differ
+    assert all(set(frame.codes.ravel().tolist()) == {0x2588} for frame, _ in played)
+
+def test_cli_import_skips_heavy_modules():
+    code = "import sys, koba.main; print(sorted(m for m in ('moviepy', 'skimage', 'matplotlib') if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
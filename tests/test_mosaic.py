@@ -0,0 +1,33 @@
+import numpy as np
+from koba.core import core, mosaic
+
+def text(codes):
+    return ["".join(map(chr, row)) for row in codes.tolist()]
+
+def test_braille_dots_follow_the_bright_sub_cells():
+    img = np.zeros((8, 8), dtype=np.uint8)
+    img[:, :1] = 255  # left column of the first cell
+    img[6:, 7:] = 255  # lower right dot of the last cell
+    assert text(mosaic.braille_codes(img, [2] * 4, [8])) == ["⡇⠀⠀⢀"]
+
+def test_block_elements_pick_quadrants_or_eighths():
+    img = np.zeros((16, 32), dtype=np.uint8)
+    img[:8, :4] = 255  # upper left quadrant
+    img[:, 12:16] = 255  # right half
+    img[12:, 16:24] = 255  # lower quarter
+    assert text(mosaic.block_codes(img, [8] * 4, [16])) == ["▘▐▂ "]
+
+def test_dither_spreads_mid_gray_over_the_sub_cells():
+    assert mosaic.bayer(2).tolist() == [[0, 2], [3, 1]]
+    img = np.full((8, 8), 128, dtype=np.uint8)
+    assert text(mosaic.braille_codes(img, [2] * 4, [8])) == ["⣿⣿⣿⣿"]
+    dithered = mosaic.braille_codes(img, [2] * 4, [8], 4)
+    lit = sum(bin(code - 0x2800).count("1") for code in dithered.ravel().tolist())
+    assert lit == 16
+
+def test_process_frame_uses_the_analytic_renderer(monkeypatch):
+    monkeypatch.setattr(core, "columns", 10)
+    img = np.zeros((100, 100), dtype=np.uint8)
+    img[:, :50] = 255
+    frame = core.process_frame(img, 2, 1.0, "diff", False, False, False, False, 9600, 9631, False, None, True, analytic="blocks")
+    assert set(str(frame).split("\n")[0]) == {"█", " "}
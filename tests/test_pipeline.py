@@ -0,0 +1,119 @@
+import os
+import sys
+import concurrent.futures
+
+import numpy as np
+import pytest
+from PIL import Image
+from koba.core import cache, charsets, core, pipeline, shm
+
+def test_pipeline_matches_process(monkeypatch):
+    monkeypatch.setattr(os, "get_terminal_size", lambda *args: os.terminal_size((20, 10)))
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, (80, 120), dtype=np.uint8)
+    frames = []
+    for i in range(6):
+        arr = base.copy()
+        arr[:20, i * 10:i * 10 + 30] = rng.integers(0, 256, (20, 30))
+        frames.append(Image.fromarray(arr))
+
+    characters = charsets.get_range(32, 126)
+    core.init_worker(characters)
+    options = (2.0, 1.0, "diff", False, False, False, False, 32, 126, False, None)
+    expected = [core.process(frame, *options, True, characters=characters) for frame in frames]
+
+    ring = shm.FrameRing(base.nbytes, n_slots=3)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            rendered = pipeline.render_frames(
+                frames, *options, executor=executor, frame_ring=ring,
+                block_cache=cache.BlockCache(2 ** 20), characters=characters, depth=3
+            )
+            assert [str(rendered_frame) for _, rendered_frame in rendered] == expected
+    finally:
+        ring.close()
+
+def test_closing_render_frames_cancels_frames_in_flight(monkeypatch):
+    monkeypatch.setattr(os, "get_terminal_size", lambda *args: os.terminal_size((20, 10)))
+    rng = np.random.default_rng(2)
+    frames = [rng.integers(0, 256, (80, 120), dtype=np.uint8) for _ in range(6)]
+
+    characters = charsets.get_range(32, 126)
+    core.init_worker(characters)
+    options = (2.0, 1.0, "diff", False, False, False, False, 32, 126, False, None)
+    ring = shm.FrameRing(frames[0].nbytes, n_slots=3)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            rendered = pipeline.render_frames(
+                frames, *options, executor=executor, frame_ring=ring,
+                block_cache=cache.BlockCache(2 ** 20), characters=characters, depth=3
+            )
+            frame, _ = next(rendered)
+            assert frame is frames[0]
+            rendered.close()
+    finally:
+        ring.close()
+
+def test_prefetch_raises_system_exit_of_the_producer():
+    def items():
+        yield 0
+        sys.exit(1)
+
+    prefetch = pipeline.Prefetch(items(), 2)
+    consumed = []
+    with pytest.raises(SystemExit):
+        for item in prefetch:
+            consumed.append(item)
+    prefetch.close()
+    assert consumed == [0]
+
+def test_prefetch_stays_bounded_and_raises_errors():
+    produced = []
+
+    def items():
+        for i in range(10):
+            produced.append(i)
+            yield i
+        raise ValueError("decoder failed")
+
+    prefetch = pipeline.Prefetch(items(), 3)
+    prefetch.wait_filled()
+    assert len(produced) <= 4
+    assert prefetch.ready()
+    consumed = []
+    with pytest.raises(ValueError):
+        for item in prefetch:
+            consumed.append(item)
+    prefetch.close()
+    assert consumed == list(range(10))
+
+def test_temporal_threshold_keeps_characters_of_unchanged_cells(monkeypatch):
+    monkeypatch.setattr(os, "get_terminal_size", lambda *args: os.terminal_size((20, 10)))
+    rng = np.random.default_rng(1)
+    base = rng.integers(8, 248, (84, 120)).astype(np.int16)
+    # sensor noise on every frame, a new patch over 2x6 cells in the last one
+    frames = [(base + rng.integers(-2, 3, base.shape)).astype(np.uint8) for _ in range(3)]
+    frames[2][:24, :36] = rng.integers(0, 256, (24, 36))
+
+    characters = charsets.get_range(32, 126)
+    core.init_worker(characters)
+    options = (2.0, 1.0, "diff", False, False, False, False, 32, 126, False, None)
+    patch = core.process_frame(frames[2], *options, True, characters=characters).codes[:2, :6]
+
+    ring = shm.FrameRing(base.size, n_slots=3)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            for pool in (None, executor):
+                block_cache = cache.BlockCache(2 ** 20)
+                rendered = [frame.codes for _, frame in pipeline.render_frames(
+                    frames, *options, executor=pool, frame_ring=ring, block_cache=block_cache,
+                    characters=characters, depth=3, temporal_threshold=4
+                )]
+                assert np.array_equal(rendered[1], rendered[0])
+                assert np.array_equal(rendered[2][:2, :6], patch)
+                rendered[2][:2, :6] = rendered[0][:2, :6]
+                assert np.array_equal(rendered[2], rendered[0])
+                # the first frame and the patch are all that was matched
+                assert block_cache.misses <= 7 * 20 + 2 * 6
+    finally:
+        ring.close()
@@ -0,0 +1,141 @@
+import re
+
+import numpy as np
+from koba import player
+from koba.core.frame import Frame
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def test_play_pass_drops_late_frames(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(player.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(player.time, "sleep", clock.sleep)
+
+    written = []
+    def write(frame):
+        written.append(frame)
+        # the first frame takes longer to draw than two frame delays
+        if frame == "a":
+            clock.now += 0.25
+
+    stats = player.PlaybackStats()
+    player.play_pass([(frame, 0.1) for frame in "abcde"], stats, write)
+    assert written == ["a", "c", "d", "e"]
+    assert stats.shown == 4 and stats.dropped == 1
+    assert abs(stats.wall_time - 0.5) < 1e-9
+    assert "target 10.0 fps, achieved 8.0 fps, 1 of 5 frames dropped" in str(stats)
+
+class SlowSource:
+    """Frames rendered at 20 fps for a 30 fps clip, none is ever waiting."""
+
+    def __init__(self, clock, count):
+        self.clock = clock
+        self.count = count
+
+    def __iter__(self):
+        for i in range(self.count):
+            self.clock.now += 1 / 20
+            yield i, 1 / 30
+
+    def ready(self):
+        return False
+
+def test_play_pass_shows_late_frames_of_a_slow_producer(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(player.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(player.time, "sleep", clock.sleep)
+
+    written = []
+    stats = player.PlaybackStats()
+    player.play_pass(SlowSource(clock, 90), stats, written.append)
+    assert written == list(range(90))
+    assert stats.shown == 90 and stats.dropped == 0
+    # the last frame stays up for its delay
+    assert "target 30.0 fps, achieved 19.9 fps, 0 of 90 frames dropped" in str(stats)
+
+class FakeTerminal:
+    """Just enough of a terminal for the sequences TerminalWriter emits."""
+
+    def __init__(self, rows, cols):
+        self.screen = [[" "] * cols for _ in range(rows)]
+        self.row = self.col = 0
+        self.cols = cols
+
+    def write(self, text):
+        for match in re.finditer(r"\033\[(\d*)([ABCJK])|(.)", text, re.S):
+            count, command, char = match.groups()
+            if command == "A":
+                self.row -= int(count)
+            elif command == "B":
+                self.row += int(count)
+            elif command == "C":
+                self.col = min(self.col + int(count), self.cols - 1)
+            elif command == "J":
+                self.screen[self.row][self.col:] = [" "] * (self.cols - self.col)
+                for line in self.screen[self.row + 1:]:
+                    line[:] = [" "] * self.cols
+            elif command == "K":
+                self.screen[self.row][self.col:] = [" "] * (self.cols - self.col)
+            elif char == "\r":
+                self.col = 0
+            elif char == "\n":
+                self.row += 1
+                self.col = 0
+            else:
+                # a wide character covers the next column as well
+                width = player.char_width(ord(char))
+                self.screen[self.row][min(self.col, self.cols - 1)] = char
+                if width == 2 and self.col + 1 < self.cols:
+                    self.screen[self.row][self.col + 1] = ""
+                self.col = min(self.col + width, self.cols)
+
+    def flush(self):
+        pass
+
+    def text(self):
+        return "\n".join("".join(line) for line in self.screen)
+
+def make_frame(text):
+    return Frame(np.array([[ord(c) for c in line] for line in text.split("\n")], dtype=np.uint32))
+
+def test_terminal_writer_redraws_changed_cells():
+    terminal = FakeTerminal(3, 40)
+    writer = player.TerminalWriter(terminal)
+    first = ["abcdefghij" * 4, "klmnopqrst" * 4, "uvwxyz0123" * 4]
+    second = [first[0][:5] + "X" + first[0][6:], first[1], first[2][:-1] + "Y"]
+    frames = ["\n".join(first), "\n".join(second), "\n".join(["." * 40] * 3)]
+    sizes = []
+    for text in frames:
+        before = writer.bytes_written
+        writer.write(make_frame(text))
+        sizes.append(writer.bytes_written - before)
+        assert terminal.text() == text
+    # two changed cells cost far less than the frame, a full change is drawn in full
+    assert sizes[1] < sizes[0] / 2
+    assert sizes[2] >= sizes[0]
+
+def test_terminal_writer_redraws_after_wide_characters():
+    terminal = FakeTerminal(2, 40)
+    writer = player.TerminalWriter(terminal)
+    first = ["漢字" + "abcdefghij" * 3, "klmnopqrst" * 3 + "かな"]
+    # a cell after wide ones, then a narrow cell that turns wide and back
+    second = [first[0][:12] + "X" + first[0][13:], first[1]]
+    third = [second[0], "漢" + first[1][1:]]
+    for lines in (first, second, third, second):
+        before = writer.bytes_written
+        writer.write(make_frame("\n".join(lines)))
+        assert [line.rstrip() for line in terminal.text().split("\n")] == lines
+    assert writer.bytes_written - before < len("".join(first).encode())
+
+def test_changed_runs_join_small_gaps():
+    changed = np.zeros(20, dtype=bool)
+    changed[[1, 2, 5, 15]] = True
+    assert player.changed_runs(changed, gap=2) == [(1, 6), (15, 16)]
@@ -0,0 +1,42 @@
+import concurrent.futures
+
+import numpy as np
+from koba.core import shm
+
+def read(ring, slot, shape):
+    with shm.read_slot(ring.name, ring.slot_bytes, slot, shape) as frame:
+        return frame.copy()
+
+def test_frame_ring_round_trip():
+    ring = shm.FrameRing(12, n_slots=2)
+    try:
+        frames = [np.full((3, 4), i, dtype=np.uint8) for i in range(3)]
+        slots = [ring.write(frame) for frame in frames]
+        assert slots == [0, 1, 0]
+        assert np.array_equal(read(ring, 1, (3, 4)), frames[1])
+        assert np.array_equal(read(ring, 0, (3, 4)), frames[2])
+
+        larger = np.arange(30, dtype=np.uint8).reshape(5, 6)
+        slot = ring.write(larger)
+        assert ring.slot_bytes >= larger.nbytes
+        assert np.array_equal(read(ring, slot, (5, 6)), larger)
+        # the segment of the replaced ring was detached, the current one stays
+        assert list(shm._attached) == [ring.name]
+    finally:
+        ring.close()
+
+def test_concurrent_readers_of_two_rings():
+    rings = [shm.FrameRing(64 * 64, n_slots=1) for _ in range(2)]
+    try:
+        for i, ring in enumerate(rings):
+            ring.write(np.full((64, 64), i + 1, dtype=np.uint8))
+
+        def total(i):
+            with shm.read_slot(rings[i % 2].name, rings[i % 2].slot_bytes, 0, (64, 64)) as frame:
+                return int(frame.sum(dtype=np.int64)) // frame.size
+
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            assert list(executor.map(total, range(2000))) == [i % 2 + 1 for i in range(2000)]
+    finally:
+        for ring in rings:
+            ring.close()
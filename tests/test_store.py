@@ -0,0 +1,23 @@
+import numpy as np
+from koba.core import store
+from koba.core.frame import Frame
+
+def test_frame_store_round_trip(tmp_path):
+    path = str(tmp_path / "render")
+    writer = store.FrameStoreWriter(path, "gif")
+    writer.append(Frame(np.array([[ord("a"), ord("b")], [ord("c"), ord("d")]], dtype=np.uint32)), 0.1)
+    writer.append(Frame(np.array([[0x2588]], dtype=np.uint32), np.array([[[1, 2, 3]]], dtype=np.uint8)), 0.2)
+
+    assert store.FrameStore.load(path) is None
+
+    frames = writer.finish()
+    assert [str(frame) for frame in frames] == ["ab\ncd", "\033[38;2;1;2;3m█\033[0m"]
+    assert frames.delays == [0.1, 0.2]
+    assert store.FrameStore.load(path).media_type == "gif"
+
+def test_render_key_depends_on_options(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"not really a png")
+
+    assert store.render_key(str(path), {"engine": "diff"}) == store.render_key(str(path), {"engine": "diff"})
+    assert store.render_key(str(path), {"engine": "diff"}) != store.render_key(str(path), {"engine": "mse"})
@@ -0,0 +1,46 @@
+import collections
+
+import numpy as np
+from koba import timing
+from koba.core import cache, core
+
+def start_profiling(monkeypatch):
+    monkeypatch.setattr(timing, "profiling", True)
+    monkeypatch.setattr(timing, "events", [])
+    monkeypatch.setattr(timing, "counters", collections.Counter())
+
+def test_stages_are_only_recorded_while_profiling(monkeypatch):
+    monkeypatch.setattr(timing, "events", [])
+    with timing.stage("convert"):
+        pass
+    assert timing.events == []
+
+    start_profiling(monkeypatch)
+    timing.set_frame(3)
+    with timing.stage("convert"):
+        pass
+    timing.set_frame(None)
+    assert [(event[0], event[5]) for event in timing.events] == [("convert", 3)]
+
+def test_profile_of_a_rendered_frame(monkeypatch):
+    monkeypatch.setattr(core, "columns", 10)
+    start_profiling(monkeypatch)
+    img = np.tile(np.arange(0, 200, 2, dtype=np.uint8), (100, 1))
+    frames = timing.timed([img, img], "decode")
+    block_cache = cache.BlockCache(2 ** 16)
+    for frame in frames:
+        core.process_frame(frame, 2, 1.0, "brightness", True, False, False, False, 32, 126, False, None, True, block_cache=block_cache)
+
+    document = timing.profile()
+    for name in ("decode", "convert", "block colors", "dedupe", "cache lookup", "match", "finish", "quantize"):
+        assert name in document["stages"]
+    assert document["stages"]["decode"]["calls"] == 2
+    assert [frame["frame"] for frame in document["frames"]] == [0, 1]
+    # the second frame is found in the cache
+    assert document["cache_hit_rate"] == 0.5
+    assert 0 < document["unique_ratio"] <= 1
+    assert "Block cache hit rate 50.0%" in timing.profile_summary(document)
+
+    trace = timing.chrome_trace()["traceEvents"]
+    assert len(trace) == len(timing.events)
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in trace)
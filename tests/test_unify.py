@@ -1,6 +1,6 @@
 import numpy as np
 import pytest
-from koba.core import unify
+from koba.core import charsets, unify
 
 
 ENGINES = ["brightness", "ssim", "diff", "mse", "ncc", "hist", "cosine"]
@@ -48,4 +48,69 @@ def test_get_font():
     if font:
         assert True
     else:
-        assert False
\ No newline at end of file
+        assert False
+
+# batch scoring has to pick the same characters as the per-glyph loop
+@pytest.mark.parametrize("engine", unify.VECTORIZED_ENGINES)
+def test_score_blocks_matches_get_character(engine):
+    rng = np.random.default_rng(0)
+    blocks = rng.integers(0, 256, size=(12, 16, 8), dtype=np.uint8)
+    blocks[0] = 0
+    blocks[1] = 255
+    blocks[2, :8] = 255
+
+    unify.set_worker_characters(charsets.get_range(32, 126))
+    expected = [unify.get_character(block, engine, False) for block in blocks]
+
+    glyph_stack = unify.get_glyph_stack(8, 16)
+    best = unify.score_blocks(blocks, glyph_stack, engine).argmax(axis=1)
+    assert [glyph_stack.characters[i] for i in best] == expected
+
+def test_score_ssim_matches_compare_character():
+    rng = np.random.default_rng(1)
+    blocks = rng.integers(0, 256, size=(4, 20, 10), dtype=np.uint8)
+
+    unify.set_worker_characters(charsets.get_range(65, 70))
+    glyph_stack = unify.get_glyph_stack(10, 20)
+    scores = unify.score_blocks(blocks, glyph_stack, "ssim")
+
+    for i, block in enumerate(blocks):
+        for j, char in enumerate(glyph_stack.characters):
+            expected = unify.compare_character(char, block, False, "ssim")
+            assert scores[i, j] == pytest.approx(expected, abs=1e-9)
+
+@pytest.mark.parametrize("engine", ["diff", "mse"])
+def test_bound_search_matches_exhaustive(engine):
+    rng = np.random.default_rng(2)
+    blocks = rng.integers(0, 256, size=(30, 16, 8), dtype=np.uint8)
+    blocks[:10] //= 8
+
+    unify.set_worker_characters(charsets.get_range(32, 126))
+    expected = unify.score_blocks(blocks, unify.get_glyph_stack(8, 16), engine).argmax(axis=1)
+
+    assert np.array_equal(unify.get_glyph_indices(blocks, engine, False, index="bnb"), expected)
+
+# probing every cluster has to give the exhaustive result
+def test_ann_index_with_all_probes_is_exact():
+    rng = np.random.default_rng(3)
+    blocks = rng.integers(0, 256, size=(30, 16, 8), dtype=np.uint8)
+
+    unify.set_worker_characters(charsets.get_range(32, 126))
+    glyph_stack = unify.get_glyph_stack(8, 16)
+    expected = unify.score_blocks(blocks, glyph_stack, "mse").argmax(axis=1)
+    n_clusters = len(glyph_stack.ann_index("mse"))
+
+    assert np.array_equal(unify.get_glyph_indices(blocks, "mse", False, index="ann", probes=n_clusters), expected)
+
+@pytest.mark.parametrize("engine", ["diff", "mse", "brightness", "ncc", "cosine"])
+def test_best_glyphs_kernel_matches_score_blocks(engine):
+    rng = np.random.default_rng(4)
+    blocks = rng.integers(0, 256, size=(20, 16, 8), dtype=np.uint8)
+    blocks[0] = 0
+    blocks[1] = 255
+
+    unify.set_worker_characters(charsets.get_range(32, 126))
+    glyph_stack = unify.get_glyph_stack(8, 16)
+    expected = unify.score_blocks(blocks, glyph_stack, engine).argmax(axis=1)
+
+    assert list(glyph_stack.best_glyphs(blocks, engine, threads=2)) == list(expected)
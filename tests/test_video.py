@@ -0,0 +1,21 @@
+import subprocess
+
+import numpy as np
+from imageio_ffmpeg import get_ffmpeg_exe
+from koba.core import video
+
+def test_video_reader_scales_and_decimates(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+    subprocess.run(
+        [get_ffmpeg_exe(), "-loglevel", "error", "-f", "lavfi", "-i", "testsrc=duration=1:size=64x48:rate=10", "-pix_fmt", "yuv420p", path],
+        check=True
+    )
+    assert video.probe(path) == ((64, 48), 10.0, 1.0)
+
+    reader = video.VideoReader(path, (32, 24), fps=5, gray=True, buffers=2)
+    frames = [frame.copy() for frame in reader]
+    assert len(frames) == 5
+    assert all(frame.shape == (24, 32) and frame.dtype == np.uint8 for frame in frames)
+
+    reader = video.VideoReader(path, (32, 24))
+    assert next(iter(reader)).shape == (24, 32, 3)